@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from protocol import HEARTBEAT_SECONDS, enable_heartbeats, new_parser
+
+READ_SIZE = 2048
+BACKLOG = 1024
+MAX_QUEUED_MESSAGES = 64
+LOG = logging.getLogger(__name__)
+
+
+class SendQueue:
+    """ The messages waiting to be written to one client.
+
+    A book snapshot, sent with send_snapshot, makes the one still waiting out of date, so it
+    replaces it and goes to the back of the queue. Any other message, such as a feed delta, a
+    result or a reply, is never dropped: put returns False once more than max_queued messages are
+    waiting and the client, which is not keeping up, should then be disconnected.
+    """
+
+    def __init__(self, max_queued=MAX_QUEUED_MESSAGES):
+        self.max_queued = max_queued
+        self.messages = deque()
+        # The waiting snapshot, wrapped in a list so it can be told apart from the other messages.
+        self.snapshot = None
+        self.replaced = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def put(self, data, is_snapshot=False):
+        if is_snapshot:
+            if self.snapshot is not None:
+                self.messages.remove(self.snapshot)
+                self.replaced += 1
+            data = self.snapshot = [data]
+        self.messages.append(data)
+        return len(self.messages) <= self.max_queued
+
+    def pop(self):
+        data = self.messages.popleft()
+        if data is self.snapshot:
+            self.snapshot = None
+            data = data[0]
+        return data
+
+    def clear(self):
+        self.messages.clear()
+        self.snapshot = None
+
+
+class AsyncClient:
+    """ A client connection owned by the event loop.
+
+    The game talks to clients through ClientCommunicator, which calls sendall, sendmsg or
+    send_snapshot. Here they only queue the bytes in a SendQueue and a writer task drains it, so a
+    slow reader never stalls the loop or the other clients, and is disconnected if it falls too
+    far behind.
+    """
+
+    def __init__(self, writer, max_queued=MAX_QUEUED_MESSAGES):
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.peername = writer.get_extra_info("peername")
+        self.queue = SendQueue(max_queued)
+        self.closed = False
+        self._has_data = asyncio.Event()
+
+    def __repr__(self):
+        return f"AsyncClient({self.peername})"
+
+    @property
+    def dropped(self):
+        """ Book snapshots replaced by a newer one before they were written. """
+        return self.queue.replaced
+
+    def sendall(self, data):
+        self._send(data, False)
+
+    def send_snapshot(self, data):
+        """ Queue a book snapshot, bytes or a tuple of buffers, in place of one still waiting. """
+        self._send(data, True)
+
+    def _send(self, data, is_snapshot):
+        if threading.get_ident() == self.loop_thread:
+            self._enqueue(data, is_snapshot)
+        else:
+            self.loop.call_soon_threadsafe(self._enqueue, data, is_snapshot)
+
+    def sendmsg(self, buffers):
+        """ Queue the buffers as one message, written with writelines. """
+        buffers = tuple(buffers)
+        self.sendall(buffers)
+        return sum(len(buffer) for buffer in buffers)
+
+    def _enqueue(self, data, is_snapshot=False):
+        if self.closed:
+            return
+        if not self.queue.put(data, is_snapshot):
+            LOG.warning(f"Disconnecting {self}, it has more than {self.queue.max_queued} messages waiting")
+            self.close()
+            return
+        self._has_data.set()
+
+    async def write_loop(self):
+        try:
+            while not self.closed:
+                await self._has_data.wait()
+                self._has_data.clear()
+                while self.queue:
+                    data = self.queue.pop()
+                    if isinstance(data, tuple):
+                        self.writer.writelines(data)
+                    else:
+                        self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.clear()
+            self._has_data.set()
+            self.writer.close()
+
+
+class AsyncServer:
+    """ Serves the game from a single event loop running in a background thread.
+
+    All callbacks (on_connect, on_messages and on_disconnect) and everything they touch, the
+    Game and its OrderBook included, run on the loop thread. Other threads hand work to the loop
+    with call_soon and call_later. on_messages gets every command parsed from one read at once.
+    """
+
+    def __init__(self, host, port, on_connect, on_messages, on_disconnect, framing="lines", heartbeat_seconds=HEARTBEAT_SECONDS):
+        self.host = host
+        self.port = port
+        self.on_connect = on_connect
+        self.on_messages = on_messages
+        self.on_disconnect = on_disconnect
+        self.framing = framing
+        self.heartbeat_seconds = heartbeat_seconds
+        self.loop = None
+        self.server = None
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="event loop", daemon=True).start()
+        self._ready.wait()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle_connection, self.host, self.port, backlog=BACKLOG)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_later(self, delay, callback):
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback)
+
+    async def handle_connection(self, reader, writer):
+        client = AsyncClient(writer)
+        connection = writer.get_extra_info("socket")
+        if self.heartbeat_seconds and connection is not None:
+            enable_heartbeats(connection, self.heartbeat_seconds)
+        parser = new_parser(self.framing)
+        writer_task = asyncio.create_task(client.write_loop())
+        self.on_connect(client)
+        try:
+            while not client.closed:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.on_messages(client, parser.feed(data))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            client.close()
+            writer_task.cancel()
+            self.on_disconnect(client)
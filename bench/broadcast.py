@@ -0,0 +1,111 @@
+""" Cost of broadcasting a message to many socket clients, before and after pre-encoded headers.
+
+Every client is one end of a socket pair with persistent information set, as in a running game.
+Two kinds of broadcast are timed: the same text to everyone ("A new game has started") and books
+of several depths plus each client's own status, as the publisher sends them. The legacy
+communicator builds and encodes a string per client; the current one encodes once and joins
+[header, body], or sends them with sendmsg when they are large. Only the sending is timed, and the best round of each is reported.
+
+Run from the repository root: python -m bench.broadcast --clients 1000
+"""
+import argparse
+import resource
+import socket
+import time
+
+from client_communication_tool import ClientCommunicator
+
+
+def book(levels):
+    return "--- ORDER BOOK ---\n\r" + "".join(f"{size:5} @ {1000 - size:5} | {1001 + size:<5} @ {size:<5}\n\r" for size in range(1, levels + 1))
+
+
+class LegacyCommunicator:
+    """ ClientCommunicator as it sent messages before headers were kept encoded. """
+
+    def __init__(self):
+        self.persistent_information = {}
+
+    def send_to_clients(self, clients, message):
+        if not isinstance(clients, list) and not isinstance(clients, set):
+            clients = [clients]
+        for client in clients:
+            client_message = message
+            if client in self.persistent_information:
+                client_message = f"{self.persistent_information[client]}\n\r{message}"
+            client.sendall(str.encode(client_message))
+
+
+def drain(sockets):
+    for s in sockets:
+        try:
+            while s.recv(1 << 20):
+                pass
+        except BlockingIOError:
+            pass
+
+
+def time_rounds(rounds, readers, before, after):
+    """ The fastest of the rounds for each broadcast, taking turns so both see the same conditions. """
+    best = [float("inf"), float("inf")]
+    for _ in range(rounds):
+        for i, broadcast in enumerate((before, after)):
+            start = time.perf_counter()
+            broadcast()
+            best[i] = min(best[i], time.perf_counter() - start)
+            drain(readers)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--clients", help="Number of connected clients", type=int, default=1000)
+    parser.add_argument("--rounds", help="Broadcasts to time", type=int, default=50)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    pairs = [socket.socketpair() for _ in range(args.clients)]
+    clients = [left for left, _ in pairs]
+    readers = [right for _, right in pairs]
+    for reader in readers:
+        reader.setblocking(False)
+
+    legacy = LegacyCommunicator()
+    current = ClientCommunicator()
+    statuses = {}
+    for client_id, client in enumerate(clients, 1):
+        information = f"You are client {client_id} and your secret is {client_id % 10 + 1}"
+        legacy.persistent_information[client] = information
+        current.add_persistent_information(client, information)
+        statuses[client] = f"--- ACCOUNT ---\n\rpos = {client_id % 3}\n\rpnl = 0\n\r--- TRADES ---\n\rBuy 1 @ 100\n\r"
+    status_bytes = {client: status.encode("utf-8") for client, status in statuses.items()}
+    client_set = set(clients)
+
+    def legacy_updates(text):
+        for client in clients:
+            legacy.send_to_clients(client, text + statuses[client])
+
+    client_tails = [(client, status_bytes[client]) for client in clients]
+
+    def current_updates(text):
+        current.send_with_tails(text.encode("utf-8"), client_tails)
+
+    results = [("same text", *time_rounds(
+        args.rounds, readers,
+        lambda: legacy.send_to_clients(client_set, "A new game has started"),
+        lambda: current.send_to_clients(client_set, "A new game has started"),
+    ))]
+    for levels in (10, 500, 2000):
+        text = book(levels)
+        results.append((f"{levels} levels", *time_rounds(args.rounds, readers, lambda: legacy_updates(text), lambda: current_updates(text))))
+    for name, before, after in results:
+        print(f"{name:<14} legacy {before * 1e6 / args.clients:6.2f} us/client  current {after * 1e6 / args.clients:6.2f} us/client  ({(before / after - 1) * 100:+.0f}%)")
+
+    for left, right in pairs:
+        left.close()
+        right.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+""" Reproducible synthetic order flow for the matching benchmarks.
+
+Each generator returns a list of operations, built up front so that generating them is not timed:
+
+    ("add", client, is_bid, size, price)
+    ("update", client, ref, size, price)
+    ("cancel", client, ref)
+
+ref is the index of the "add" operation that created the order. The same seed always gives the
+same flow.
+"""
+import random
+
+CLIENTS = 200
+
+
+def random_walk(count, seed=1, fair_value=1000, spread=10):
+    """ Passive and marketable limit orders around a fair value that drifts as a random walk. """
+    rnd = random.Random(seed)
+    ops = []
+    adds = []
+    for _ in range(count):
+        fair_value = max(spread + 1, fair_value + rnd.choice((-1, 0, 1)))
+        client = rnd.randrange(CLIENTS)
+        is_bid = rnd.random() < 0.5
+        offset = rnd.randint(-2, spread)
+        price = fair_value - offset if is_bid else fair_value + offset
+        r = rnd.random()
+        if r < 0.6 or not adds:
+            adds.append(len(ops))
+            ops.append(("add", client, is_bid, rnd.randint(1, 10), price))
+        elif r < 0.9:
+            ops.append(("update", client, rnd.choice(adds), rnd.randint(1, 10), price))
+        else:
+            ops.append(("cancel", client, rnd.choice(adds)))
+    return ops
+
+
+def sweeps(count, seed=1, fair_value=1000, depth=50):
+    """ A resting book that is refilled and then swept through several levels by large orders. """
+    rnd = random.Random(seed)
+    ops = []
+    while len(ops) < count:
+        for _ in range(depth):
+            is_bid = rnd.random() < 0.5
+            offset = rnd.randint(1, depth)
+            price = fair_value - offset if is_bid else fair_value + offset
+            ops.append(("add", rnd.randrange(CLIENTS), is_bid, rnd.randint(1, 5), price))
+        is_bid = rnd.random() < 0.5
+        price = fair_value + depth if is_bid else fair_value - depth
+        ops.append(("add", rnd.randrange(CLIENTS), is_bid, rnd.randint(depth, 3 * depth), price))
+    return ops[:count]
+
+
+def cancel_replace(count, seed=1, fair_value=1000, spread=5):
+    """ Market makers holding one bid and one ask each and re-quoting them on every tick. """
+    rnd = random.Random(seed)
+    ops = []
+    quotes = {}
+    while len(ops) < count:
+        fair_value = max(spread + 1, fair_value + rnd.choice((-1, 0, 1)))
+        client = rnd.randrange(CLIENTS)
+        is_bid = rnd.random() < 0.5
+        price = fair_value - rnd.randint(1, spread) if is_bid else fair_value + rnd.randint(1, spread)
+        ref = quotes.get((client, is_bid))
+        if ref is None or rnd.random() < 0.02:
+            if ref is not None:
+                ops.append(("cancel", client, ref))
+            quotes[client, is_bid] = len(ops)
+            ops.append(("add", client, is_bid, 1, price))
+        else:
+            ops.append(("update", client, ref, 1, price))
+    return ops[:count]
+
+
+def deep_book(count, seed=1, fair_value=100000, levels=5000):
+    """ Thousands of price levels on each side, with trading and re-quoting at the top of the book. """
+    rnd = random.Random(seed)
+    ops = []
+    adds = []
+    for level in range(1, levels + 1):
+        for is_bid in (True, False):
+            price = fair_value - level if is_bid else fair_value + level
+            adds.append(len(ops))
+            ops.append(("add", rnd.randrange(CLIENTS), is_bid, rnd.randint(1, 10), price))
+    while len(ops) < count:
+        is_bid = rnd.random() < 0.5
+        offset = rnd.randint(-3, 20)
+        price = fair_value - offset if is_bid else fair_value + offset
+        if rnd.random() < 0.7:
+            adds.append(len(ops))
+            ops.append(("add", rnd.randrange(CLIENTS), is_bid, rnd.randint(1, 10), price))
+        else:
+            ops.append(("update", rnd.randrange(CLIENTS), rnd.choice(adds), rnd.randint(1, 10), price))
+    return ops[:count]
+
+
+SCENARIOS = {
+    "random_walk": random_walk,
+    "sweeps": sweeps,
+    "cancel_replace": cancel_replace,
+    "deep_book": deep_book,
+}
@@ -0,0 +1,167 @@
+""" Load test for the asyncio server: connections held and order round-trip latency.
+
+The server runs in-process on a free port. The load test connects --clients clients, starts a game
+with all of them and sends --orders orders one at a time from randomly chosen clients. For each
+order it times how long the sender takes to see the book update, and how long until every client
+has seen it. Every order moves the sender's quote, so every order changes the book.
+
+Run from the repository root: python -m bench.load --clients 2000 --orders 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+import server
+from async_server import AsyncServer, READ_SIZE
+
+BOOK_HEADER = b"--- ORDER BOOK ---"
+CONNECT_BATCH = 200
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return {"p50": samples[0] if samples else None, "p99": samples[0] if samples else None}
+    cuts = statistics.quantiles(samples, n=100)
+    return {"p50": cuts[49], "p99": cuts[98]}
+
+
+class RoundTrips:
+    """ Times each order from the moment it is sent until its update reaches the sender and every client. """
+
+    def __init__(self, client_count):
+        self.client_count = client_count
+        self.sent_at = {}
+        self.sender = {}
+        self.arrivals = Counter()
+        self.complete = {}
+        self.sender_latency = []
+        self.fan_out_latency = []
+
+    def sent(self, update_number, client):
+        self.sender[update_number] = client
+        self.complete[update_number] = asyncio.Event()
+        self.sent_at[update_number] = time.perf_counter()
+
+    def arrived(self, client, update_number):
+        if update_number not in self.sent_at:
+            # The book sent when the game starts, before any order.
+            return
+        elapsed = time.perf_counter() - self.sent_at[update_number]
+        if self.sender[update_number] is client:
+            self.sender_latency.append(elapsed)
+        self.arrivals[update_number] += 1
+        if self.arrivals[update_number] == self.client_count:
+            self.fan_out_latency.append(elapsed)
+            self.complete[update_number].set()
+
+
+class LoadClient:
+
+    def __init__(self, reader, writer, round_trips):
+        self.reader = reader
+        self.writer = writer
+        self.round_trips = round_trips
+        self.updates = 0
+        self.bytes_received = 0
+
+    async def read_loop(self):
+        tail = b""
+        while True:
+            data = await self.reader.read(READ_SIZE)
+            if not data:
+                return
+            self.bytes_received += len(data)
+            chunk = tail + data
+            tail = chunk[-(len(BOOK_HEADER) - 1):]
+            for _ in range(chunk.count(BOOK_HEADER)):
+                self.updates += 1
+                self.round_trips.arrived(self, self.updates)
+
+    def send(self, command):
+        self.writer.write(command.encode("utf-8") + b"\n")
+
+
+async def wait_for(condition, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Server did not get there in time")
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    async_server = AsyncServer("127.0.0.1", 0, server.client_connected, server.handle_client_messages, server.client_disconnected)
+    server.game_schedule = async_server.call_later
+    server.publish_hz = args.publish_hz
+    async_server.start()
+    game = server.registry.room().game
+
+    round_trips = RoundTrips(args.clients)
+    clients = []
+    start = time.perf_counter()
+    for first in range(0, args.clients, CONNECT_BATCH):
+        count = min(CONNECT_BATCH, args.clients - first)
+        connections = await asyncio.gather(*[asyncio.open_connection("127.0.0.1", async_server.port) for _ in range(count)])
+        clients.extend(LoadClient(reader, writer, round_trips) for reader, writer in connections)
+    await wait_for(lambda: len(server.connected_clients) == args.clients)
+    connect_seconds = time.perf_counter() - start
+    readers = [asyncio.create_task(client.read_loop()) for client in clients]
+
+    async_server.call_soon(server.start_game, 3600, False)
+    await wait_for(game.is_started)
+    # Every player is sent the empty book when the game starts; it answers none of the orders.
+    await wait_for(lambda: all(client.updates for client in clients))
+    for client in clients:
+        client.updates = 0
+
+    rnd = random.Random(args.seed)
+    last_quote = {}
+    start = time.perf_counter()
+    for update_number in range(1, args.orders + 1):
+        client = rnd.choice(clients)
+        side = rnd.choice("bs")
+        price = rnd.randint(40, 60)
+        while last_quote.get((client, side)) == price:
+            price = rnd.randint(40, 60)
+        last_quote[client, side] = price
+        round_trips.sent(update_number, client)
+        client.send(f"{side}{price}")
+        await asyncio.wait_for(round_trips.complete[update_number].wait(), timeout=30)
+    order_seconds = time.perf_counter() - start
+
+    for reader in readers:
+        reader.cancel()
+    publisher = game.publisher
+    return {
+        "clients": args.clients,
+        "connections_held": len(server.connected_clients),
+        "connect_seconds": connect_seconds,
+        "orders": args.orders,
+        "orders_per_second": args.orders / order_seconds,
+        "sender_latency_ms": {k: v * 1000 for k, v in percentiles(round_trips.sender_latency).items()},
+        "fan_out_latency_ms": {k: v * 1000 for k, v in percentiles(round_trips.fan_out_latency).items()},
+        "bytes_received": sum(client.bytes_received for client in clients),
+        "flushes": publisher.flushes,
+        "bytes_per_flush": publisher.bytes_sent / max(publisher.flushes, 1),
+        "render_ms_per_flush": publisher.render_seconds * 1000 / max(publisher.flushes, 1),
+        "messages_dropped": sum(client.dropped for client in server.connected_clients),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--clients", help="Number of concurrent connections", type=int, default=1000)
+    parser.add_argument("--orders", help="Number of orders to time", type=int, default=200)
+    parser.add_argument("--publish-hz", help="Most book updates the server sends per second, 0 for one per order", type=float, default=0)
+    parser.add_argument("--seed", help="Random seed for the order flow", type=int, default=1)
+    args = parser.parse_args()
+
+    for name, value in asyncio.run(run(args)).items():
+        print(f"{name:<20} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+""" Matching engine microbenchmarks over the synthetic order flow in bench.flow.
+
+For every scenario this reports throughput in orders per second, p50/p99 latency of add_order,
+update_order, cancel_order and _match, and the peak memory of the book, then writes the results as
+JSON. Passing an earlier results file as --baseline prints the throughput change against it.
+
+An update re-quotes the way Game.make_order does: it amends the order if it still rests in the
+book and places a new one otherwise.
+
+Run from the repository root:
+
+    python -m bench.matching --orders 100000 --output before.json
+    python -m bench.matching --orders 100000 --output after.json --baseline before.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from bench.flow import SCENARIOS
+from orderbook import OrderBook
+
+
+class TimedOrderBook(OrderBook):
+    """ Records how long every call to _match takes. """
+
+    def __init__(self):
+        super().__init__()
+        self.match_ns = []
+
+    def _match(self, order):
+        start = time.perf_counter_ns()
+        super()._match(order)
+        self.match_ns.append(time.perf_counter_ns() - start)
+
+
+def apply(orderbook, ops):
+    ids = {}
+    for i, op in enumerate(ops):
+        if op[0] == "add":
+            ids[i] = orderbook.add_order(op[1], op[2], op[3], op[4])
+        elif op[0] == "update":
+            requote(orderbook, ops, ids, op)
+        else:
+            orderbook.cancel_order(op[1], ids[op[2]])
+
+
+def requote(orderbook, ops, ids, op):
+    _, client, ref, size, price = op
+    if orderbook.update_order(client, ids[ref], size, price) is None:
+        _, client, is_bid, _, _ = ops[ref]
+        ids[ref] = orderbook.add_order(client, is_bid, size, price)
+
+
+def apply_timed(orderbook, ops):
+    ids = {}
+    latency_ns = {"add_order": [], "update_order": [], "cancel_order": []}
+    clock = time.perf_counter_ns
+    for i, op in enumerate(ops):
+        if op[0] == "add":
+            start = clock()
+            ids[i] = orderbook.add_order(op[1], op[2], op[3], op[4])
+            latency_ns["add_order"].append(clock() - start)
+        elif op[0] == "update":
+            start = clock()
+            requote(orderbook, ops, ids, op)
+            latency_ns["update_order"].append(clock() - start)
+        else:
+            start = clock()
+            orderbook.cancel_order(op[1], ids[op[2]])
+            latency_ns["cancel_order"].append(clock() - start)
+    return latency_ns
+
+
+def summarize(samples_ns):
+    if not samples_ns:
+        return {"count": 0, "p50_us": None, "p99_us": None}
+    if len(samples_ns) == 1:
+        return {"count": 1, "p50_us": samples_ns[0] / 1000, "p99_us": samples_ns[0] / 1000}
+    cuts = statistics.quantiles(samples_ns, n=100)
+    return {"count": len(samples_ns), "p50_us": cuts[49] / 1000, "p99_us": cuts[98] / 1000}
+
+
+def run_scenario(generate, orders, seed, repeat):
+    ops = generate(orders, seed=seed)
+
+    best_seconds = None
+    for _ in range(repeat):
+        orderbook = OrderBook()
+        start = time.perf_counter()
+        apply(orderbook, ops)
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+
+    orderbook = TimedOrderBook()
+    latency_ns = apply_timed(orderbook, ops)
+    latency_ns["_match"] = orderbook.match_ns
+
+    tracemalloc.start()
+    apply(OrderBook(), ops)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "orders": len(ops),
+        "orders_per_second": len(ops) / best_seconds,
+        "latency": {name: summarize(samples) for name, samples in latency_ns.items()},
+        "peak_memory_bytes": peak,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline):
+    for name, result in results["scenarios"].items():
+        line = f"{name:<16} {result['orders_per_second']:>12,.0f} orders/s  peak {result['peak_memory_bytes'] / 2 ** 20:7.1f} MiB"
+        if baseline and name in baseline["scenarios"]:
+            before = baseline["scenarios"][name]["orders_per_second"]
+            line += f"  ({(result['orders_per_second'] / before - 1) * 100:+.1f}% vs {baseline.get('commit')})"
+        print(line)
+        for call, latency in result["latency"].items():
+            if latency["count"]:
+                print(f"    {call:<14} p50 {latency['p50_us']:8.2f} us  p99 {latency['p99_us']:8.2f} us  ({latency['count']} calls)")
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--orders", help="Number of operations per scenario", type=int, default=100000)
+    parser.add_argument("--seed", help="Random seed for the order flow", type=int, default=1)
+    parser.add_argument("--repeat", help="Throughput runs per scenario, the fastest is kept", type=int, default=3)
+    parser.add_argument("--scenario", help="Only run these scenarios", choices=sorted(SCENARIOS), action="append")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare throughput with this earlier results file")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "orders": args.orders,
+        "seed": args.seed,
+        "scenarios": {},
+    }
+    for name in args.scenario or SCENARIOS:
+        results["scenarios"][name] = run_scenario(SCENARIOS[name], args.orders, args.seed, args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+""" Memory used per resting order and per trade, before and after the compact storage.
+
+Run from the repository root: python -m bench.memory --orders 1000000
+"""
+import argparse
+import gc
+import tracemalloc
+from collections import namedtuple
+
+from orderbook import Order, OrderBook
+
+LegacyTrade = namedtuple("LegacyTrade", "is_buy size price")
+
+
+class LegacyOrder:
+    """ Order as it was stored before __slots__, with a per-instance __dict__. """
+
+    def __init__(self, order_id, client_id, is_bid, size, price):
+        self.id = order_id
+        self.client_id = client_id
+        self.is_bid = is_bid
+        self.size = size
+        self.price = price
+        self.level = None
+        self.prev = None
+        self.next = None
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    kept = build(count)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return (after - before) / count
+
+
+def legacy_orders(count):
+    return [LegacyOrder(i, i % 100, True, 1, 100 + i % 1000) for i in range(count)]
+
+
+def compact_orders(count):
+    return [Order(i, i % 100, True, 1, 100 + i % 1000) for i in range(count)]
+
+
+def resting_orders(count):
+    ob = OrderBook()
+    for i in range(count):
+        ob.add_order(i % 100, True, 1, 100 + i % 1000)
+    return ob
+
+
+def legacy_trades(count):
+    client2trades = {}
+    for i in range(count):
+        client2trades.setdefault(i % 100, []).append(LegacyTrade(True, 1, 100 + i % 1000))
+        client2trades.setdefault((i + 1) % 100, []).append(LegacyTrade(False, 1, 100 + i % 1000))
+    return client2trades
+
+
+def compact_trades(count):
+    ob = OrderBook()
+    buy = Order(0, 0, True, 1, 0)
+    sell = Order(0, 0, False, 1, 0)
+    for i in range(count):
+        buy.client_id = i % 100
+        sell.client_id = (i + 1) % 100
+        ob.handle_fills([(buy, sell, 1, 100 + i % 1000)])
+    return ob
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--orders", help="Number of orders and trades to allocate", type=int, default=1000000)
+    args = parser.parse_args()
+
+    rows = [
+        ("order object, __dict__", measure(legacy_orders, args.orders)),
+        ("order object, __slots__", measure(compact_orders, args.orders)),
+        ("resting order in OrderBook", measure(resting_orders, args.orders)),
+        ("trade, namedtuple lists", measure(legacy_trades, args.orders)),
+        ("trade, columnar TradeLog", measure(compact_trades, args.orders)),
+    ]
+    print(f"bytes per item at {args.orders} items")
+    for name, size in rows:
+        print(f"{name:<30} {size:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
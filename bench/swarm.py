@@ -0,0 +1,142 @@
+""" Swarm of headless bots trading against server.py, from a handful of clients to thousands.
+
+For every --clients count the swarm starts a fresh `server.py --engine asyncio` on a free port,
+connects that many bots (see bot.py), types "start" into the server console and lets the bots
+quote for --seconds. It reports how many orders the server answered per second, the latency from
+sending an order until the book update showing it arrives, and the rate of dropped (delta sequence
+gaps) and garbled (not JSON) feed messages. With --server HOST:PORT the bots join a server that is
+already running instead, and the game has to be started there by hand.
+
+Run from the repository root: python -m bench.swarm --clients 10 100 1000 5000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from bench.load import percentiles
+from bot import Bot
+
+CONNECT_BATCH = 200
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def raise_open_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, args):
+    command = [
+        sys.executable, "server.py", "--engine", "asyncio", "--port", str(port),
+        "--duration", str(int(args.seconds) + 60), "--publish-hz", str(args.publish_hz),
+    ]
+    return subprocess.Popen(command, cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+async def connect_bots(count, host, port, args):
+    bots = [Bot(count, args.spread, seed=args.seed + i) for i in range(count)]
+    for first in range(0, count, CONNECT_BATCH):
+        batch = bots[first:first + CONNECT_BATCH]
+        for deadline in range(50):
+            try:
+                await asyncio.gather(*[bot.connect(host, port) for bot in batch if bot.writer is None])
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+    return [bot for bot in bots if bot.writer is not None]
+
+
+async def run_swarm(count, args):
+    server = None
+    if args.server:
+        host, port = args.server.rsplit(":", 1)
+        port = int(port)
+    else:
+        host, port = "127.0.0.1", free_port()
+        server = start_server(port, args)
+    try:
+        start = time.perf_counter()
+        bots = await connect_bots(count, host, port, args)
+        connect_seconds = time.perf_counter() - start
+        readers = [asyncio.create_task(bot.read_loop()) for bot in bots]
+
+        if server is not None:
+            # Give the server time to register the last connections before the game takes them in.
+            await asyncio.sleep(0.5)
+            server.stdin.write(b"start\n")
+            server.stdin.flush()
+        else:
+            print("Start a game on the server")
+        await wait_for(lambda: all(bot.secret is not None for bot in bots), args.seconds + (10 if server else 600))
+        identified = sum(bot.secret is not None for bot in bots)
+
+        traders = [asyncio.create_task(bot.trade_loop(args.interval)) for bot in bots]
+        start = time.perf_counter()
+        await asyncio.sleep(args.seconds)
+        seconds = time.perf_counter() - start
+        for task in traders + readers:
+            task.cancel()
+    finally:
+        if server is not None:
+            server.kill()
+            server.wait()
+    for bot in bots:
+        bot.close()
+
+    latencies = [latency for bot in bots for latency in bot.latencies]
+    messages = sum(bot.messages + bot.garbled for bot in bots)
+    return {
+        "clients": count,
+        "connected": len(bots),
+        "identified": identified,
+        "connect_seconds": connect_seconds,
+        "orders_sent": sum(bot.orders_sent for bot in bots),
+        "orders_answered_per_second": len(latencies) / seconds,
+        "latency_ms": {k: v * 1000 if v is not None else None for k, v in percentiles(latencies).items()},
+        "unanswered": sum(bot.unanswered for bot in bots),
+        "messages": messages,
+        "dropped_rate": sum(bot.gaps for bot in bots) / max(messages, 1),
+        "garbled_rate": sum(bot.garbled for bot in bots) / max(messages, 1),
+        "megabytes_received": sum(bot.bytes_received for bot in bots) / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--clients", help="Numbers of bots to run, one swarm each", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--seconds", help="How long each swarm trades", type=float, default=10)
+    parser.add_argument("--interval", help="Mean seconds between each bot's orders", type=float, default=1)
+    parser.add_argument("--spread", help="How far from their estimate the bots quote", type=int, default=2)
+    parser.add_argument("--publish-hz", help="Most book updates the server sends per second", type=float, default=20)
+    parser.add_argument("--server", help="HOST:PORT of a running server to use instead of starting one")
+    parser.add_argument("--seed", help="Random seed for the bots", type=int, default=1)
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    for count in args.clients:
+        print(f"--- {count} clients ---")
+        for name, value in asyncio.run(run_swarm(count, args)).items():
+            print(f"{name:<28} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+""" A headless trader for load tests and simulations, using asyncio instead of the Tk client.
+
+A bot subscribes to the market data feed, learns its secret from the "You are client X and your
+secret is Y" line, estimates the fair price as its secret plus the expected secret of every other
+player, and quotes around it with the usual b<price> and s<price> commands. It keeps count of what
+it saw: order-to-update latencies, feed messages that were not valid JSON and gaps in the delta
+sequence, which mean the server dropped messages.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+
+from feed import SUBSCRIBE_COMMAND, LocalBook
+
+IDENTITY = re.compile(r"You are client (\d+) and your secret is (\d+)")
+RESULT_HEADER = "--- RESULT ---"
+READ_SIZE = 65536
+ORDER_TIMEOUT_SECONDS = 5
+MEAN_SECRET = 5.5
+
+
+def parse_identity(text):
+    """ The (client id, secret) in a server message, or None if it has none. """
+    match = IDENTITY.search(text)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def estimate_fair_price(secret, players):
+    return secret + MEAN_SECRET * (players - 1)
+
+
+class Bot:
+    def __init__(self, players, spread=2, seed=None):
+        self.players = players
+        self.spread = spread
+        self.random = random.Random(seed)
+        self.book = LocalBook()
+        self.reader = None
+        self.writer = None
+        self.client_id = None
+        self.secret = None
+        self.game_over = False
+        self.quotes = {"b": None, "s": None}
+        self.pending = None
+        self.orders_sent = 0
+        self.latencies = []
+        self.unanswered = 0
+        self.messages = 0
+        self.garbled = 0
+        self.gaps = 0
+        self.bytes_received = 0
+
+    async def connect(self, host, port):
+        """ Connect, wait for the greeting and subscribe to the feed. """
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        greeting = await self.reader.read(READ_SIZE)
+        self.bytes_received += len(greeting)
+        self.send(SUBSCRIBE_COMMAND)
+
+    def send(self, command):
+        self.writer.write(command.encode("utf-8") + b"\n")
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    async def read_loop(self):
+        tail = b""
+        while True:
+            data = await self.reader.read(READ_SIZE)
+            if not data:
+                return
+            self.bytes_received += len(data)
+            *lines, tail = (tail + data).split(b"\n")
+            for line in lines:
+                self.handle_line(line)
+
+    def handle_line(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            self.garbled += 1
+            return
+        if not isinstance(message, dict):
+            self.garbled += 1
+            return
+        self.handle_message(message)
+
+    def handle_message(self, message):
+        self.messages += 1
+        kind = message.get("type")
+        if kind in ("text", "snapshot"):
+            text = message.get("text") or message.get("info") or ""
+            identity = parse_identity(text)
+            if identity is not None:
+                self.client_id, self.secret = identity
+            if RESULT_HEADER in text:
+                self.game_over = True
+        if kind in ("delta", "status"):
+            self.check_pending(message)
+        was_in_sync = self.book.in_sync()
+        self.book.apply(message)
+        if kind == "delta" and was_in_sync and not self.book.in_sync():
+            self.gaps += 1
+            self.send(SUBSCRIBE_COMMAND)
+
+    def check_pending(self, message):
+        """ The pending order is answered by the first delta that touches its price, or by a change to our trades. """
+        if self.pending is None:
+            return
+        command, price, sent_at = self.pending
+        side = "bid" if command == "b" else "ask"
+        if message["type"] == "status":
+            touched = True
+        else:
+            touched = any(level[1] == side and level[2] == price for level in message["levels"])
+            touched = touched or any(trade[0] == price for trade in message["trades"])
+        if touched:
+            self.latencies.append(time.perf_counter() - sent_at)
+            self.pending = None
+
+    def next_order(self):
+        """ The next b<price> or s<price> to send, always a different price from the current quote. """
+        fair_price = estimate_fair_price(self.secret, self.players)
+        command = self.random.choice("bs")
+        offset = self.spread + self.random.randint(-1, 1)
+        price = max(1, round(fair_price - offset if command == "b" else fair_price + offset))
+        if price == self.quotes[command]:
+            price += 1
+        self.quotes[command] = price
+        return command, price
+
+    def trade(self):
+        """ Send one order if the bot knows its secret and has no order waiting for an update. """
+        if self.secret is None or self.game_over:
+            return False
+        if self.pending is not None:
+            if time.perf_counter() - self.pending[2] < ORDER_TIMEOUT_SECONDS:
+                return False
+            self.unanswered += 1
+        command, price = self.next_order()
+        self.pending = (command, price, time.perf_counter())
+        self.orders_sent += 1
+        self.send(f"{command}{price}")
+        return True
+
+    async def trade_loop(self, interval):
+        await asyncio.sleep(self.random.uniform(0, interval))
+        while not self.game_over:
+            self.trade()
+            await asyncio.sleep(interval * self.random.uniform(0.5, 1.5))
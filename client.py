@@ -1,11 +1,16 @@
 import _thread
 import argparse
+import json
 import logging
+import queue
 import socket
+import time
 from tkinter import *
 from tkinter import ttk
 from tkinter import messagebox
 
+from feed import SUBSCRIBE_COMMAND, LocalBook
+
 
 HELP_MSG = """
 --- MARKET MAKING GAME ---
@@ -21,6 +26,10 @@ If you want to buy the instrument for the price "20", type "b20" in the command
 
 If you want to sell the instrument for the price "30", type "s30" in the command box and press enter.
 
+To quote both sides at once, type "size@bid|ask@size". E.g. "10@20|30@5" bids 20 for 10 and offers 5 at 30, replacing your current bid and ask. A size of 0 pulls that side.
+
+Your last trades are shown below your account. Type "trades" to see all of them, or "trades 2" for the second page.
+
 Good luck!
 """
 
@@ -30,12 +39,24 @@ def show_help():
 
 
 class Gui:
+    """ The client window. Tk is only touched from the thread running mainloop.
+
+    Other threads hand text to show to set_output, which only queues it. The Tk thread drains the
+    queue at most MAX_FPS times a second and draws the newest text, so a burst of updates costs one
+    redraw.
+    """
+
+    EXIT = object()
+
     def __init__(self):
         self.root = Tk()
         self.frm = ttk.Frame(self.root, padding=10)
         self.frm.grid()
 
         self.connection = None
+        self.updates = queue.SimpleQueue()
+        self.shown = ""
+        self.last_log_time = 0
 
         self.output_box = Text(self.frm, wrap="none", width=100)
         self.output_box.grid(row=0, columnspan=24)
@@ -47,11 +68,53 @@ class Gui:
         Button(self.frm, command=show_help, text="Help").grid(row=1, column=1)
 
     def start(self):
+        self.root.after(0, self.draw)
         self.root.mainloop()
 
     def set_output(self, message):
-        self.output_box.delete(1.0, "end")
-        self.output_box.insert("end", message)
+        """ Show message with the next frame. Safe to call from any thread. """
+        self.updates.put(message)
+
+    def draw(self):
+        message = None
+        while True:
+            try:
+                update = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if update is self.EXIT:
+                self.root.destroy()
+                return
+            message = update
+        if message is not None and message != self.shown:
+            if DIFF_UPDATES:
+                self.replace_changed_lines(message)
+            else:
+                self.output_box.delete(1.0, "end")
+                self.output_box.insert("end", message)
+            self.shown = message
+            self.log(message)
+        self.root.after(max(1, round(1000 / MAX_FPS)), self.draw)
+
+    def replace_changed_lines(self, message):
+        """ Rewrite only the lines of the text box that differ from message. """
+        old_lines = self.shown.split("\n")
+        new_lines = message.split("\n")
+        for number, (old_line, new_line) in enumerate(zip(old_lines, new_lines), 1):
+            if old_line != new_line:
+                self.output_box.delete(f"{number}.0", f"{number}.end")
+                self.output_box.insert(f"{number}.0", new_line)
+        if len(new_lines) > len(old_lines):
+            self.output_box.insert("end-1c", "\n" + "\n".join(new_lines[len(old_lines):]))
+        elif len(new_lines) < len(old_lines):
+            self.output_box.delete(f"{len(new_lines)}.end", "end-1c")
+
+    def log(self, message):
+        """ Log what is shown, at most once every LOG_SECONDS. """
+        now = time.monotonic()
+        if now - self.last_log_time >= LOG_SECONDS:
+            self.last_log_time = now
+            info_log(message)
 
     def set_connection(self, in_connection):
         self.connection = in_connection
@@ -59,11 +122,11 @@ class Gui:
     def send_to_server(self, _):
         if self.connection is not None:
             entered_command = self.input_box.get()
-            self.connection.send(str.encode(entered_command))
+            self.connection.send(str.encode(entered_command + "\n"))
         self.input_box.delete(0, "end")
 
     def exit(self):
-        self.root.destroy()
+        self.updates.put(self.EXIT)
 
 
 LOG = logging.getLogger(__name__)
@@ -71,6 +134,10 @@ LOG_FILE = "market-making-game-client.log"
 CONSOLE_FORMATTER_PATTERN = "%(message)s"
 HOST = "127.0.0.1"
 PORT = 1234
+FEED = False
+MAX_FPS = 30
+DIFF_UPDATES = False
+LOG_SECONDS = 1
 gui = Gui()
 
 
@@ -90,15 +157,75 @@ def info_log(msg):
     LOG.info(str(msg))
 
 
+class FeedView:
+    """ Keeps a local copy of the book from the server's JSON feed and redraws only when the view changes. """
+
+    def __init__(self):
+        self.buffer = b""
+        self.local_book = LocalBook()
+        self.resync_requested = False
+        self.shown = None
+
+    def on_data(self, data, client_socket):
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            # Text the server sent before the subscription, like its greeting, has no newline of its own.
+            start = line.find(b"{")
+            if start < 0:
+                continue
+            try:
+                message = json.loads(line[start:])
+            except ValueError:
+                LOG.warning(f"Skipped a feed line that is not JSON: {line[:80]}")
+                continue
+            if message["type"] == "text":
+                self.show(message["text"])
+            elif self.local_book.apply(message) and self.local_book.in_sync():
+                self.resync_requested = False
+                self.show(self.local_book.render())
+            elif not self.local_book.in_sync() and not self.resync_requested:
+                self.resync_requested = True
+                subscribe(client_socket)
+
+    def show(self, text):
+        if text != self.shown:
+            self.shown = text
+            gui.set_output(text)
+
+
+def subscribe(client_socket):
+    client_socket.send(str.encode(SUBSCRIBE_COMMAND + "\n"))
+
+
+def start_feed(client_socket):
+    """ Show the server's greeting, which is plain text, then subscribe to the feed. """
+    greeting = client_socket.recv(2048)
+    if not greeting:
+        raise ConnectionResetError("The server closed the connection")
+    gui.set_output(greeting.decode("utf-8", "replace"))
+    subscribe(client_socket)
+
+
 def listener_thread(client_socket):
     global gui
     global connection
 
     connected = True
+    feed_view = FeedView()
+    subscribed = False
     while True:
         try:
+            if FEED and not subscribed:
+                start_feed(client_socket)
+                subscribed = True
             response = client_socket.recv(2048)
+            if not response:
+                raise ConnectionResetError("The server closed the connection")
             connected = True
+            if FEED:
+                feed_view.on_data(response, client_socket)
+                continue
             message = response.decode("utf-8")
 
             if message.strip() == "REJECT":
@@ -106,7 +233,6 @@ def listener_thread(client_socket):
                 gui.exit()
 
             if not message == "":
-                info_log(message)
                 gui.set_output(message)
         except (ConnectionResetError, OSError):
             info_log("Trying to reconnect")
@@ -119,6 +245,9 @@ def listener_thread(client_socket):
                 client_socket = socket.socket()
                 client_socket.connect((HOST, PORT))
                 gui.set_connection(client_socket)
+                if FEED:
+                    feed_view = FeedView()
+                    subscribed = False
             except ConnectionRefusedError:
                 pass
 
@@ -143,10 +272,18 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--host", help="Host name", default=HOST)
     parser.add_argument("--port", help="Port", type=int, default=PORT)
+    parser.add_argument("--feed", help="Receive order book deltas from the server and keep the book locally", action="store_true")
+    parser.add_argument("--max-fps", help="Most times a second the window is redrawn", type=float, default=MAX_FPS)
+    parser.add_argument("--diff-updates", help="Redraw only the lines that changed instead of the whole window", action="store_true")
+    parser.add_argument("--log-seconds", help="Log what is shown at most this often", type=float, default=LOG_SECONDS)
     args = parser.parse_args()
 
     HOST = args.host
     PORT = args.port
+    FEED = args.feed
+    MAX_FPS = args.max_fps
+    DIFF_UPDATES = args.diff_updates
+    LOG_SECONDS = args.log_seconds
 
     connect_to_server(args.host, args.port)
     gui.start()
@@ -1,32 +1,157 @@
+import json
+
+SEPARATOR = "\n\r"
+# Below this a sendmsg call costs more than joining the parts into one buffer.
+SCATTER_MIN_BYTES = 32768
+FEED_TEXT_PREFIX = b'{"type":"text","text":"'
+FEED_TEXT_SUFFIX = b'"}\n'
+
+
 def to_iterable(clients):
     if not isinstance(clients, list) and not isinstance(clients, set):
         clients = [clients]
     return clients
 
 
+def escape(text):
+    """ text as it appears inside a JSON string written by feed.encode, without the quotes. """
+    return json.dumps(text)[1:-1].encode("ascii")
+
+
+def send_parts(client, parts):
+    """ Send the parts as one message, scatter-gather if it is large and the client can. Returns the number of bytes sent. """
+    total = sum(map(len, parts))
+    sendmsg = getattr(client, "sendmsg", None) if total >= SCATTER_MIN_BYTES else None
+    if sendmsg is None:
+        client.sendall(parts[0] if len(parts) == 1 else b"".join(parts))
+        return total
+    sent = sendmsg(parts)
+    if sent < total:
+        client.sendall(b"".join(parts)[sent:])
+    return total
+
+
 class ClientCommunicator:
+    """ Sends server messages to clients, each after the client's persistent information.
+
+    The persistent information is kept encoded, both as text and as a piece of a JSON feed
+    message, so a message is encoded once however many clients it goes to and is sent to each
+    of them as [header, message] without building a string per client.
+    """
+
     def __init__(self):
         self.persistent_information = {}
+        self.client2header = {}
+        self.client2feed_header = {}
+        self.feed_clients = set()
+
+    def subscribe_to_feed(self, client):
+        """ From now on the client gets JSON feed messages instead of text. """
+        self.feed_clients.add(client)
+
+    def is_feed_client(self, client):
+        return client in self.feed_clients
 
     def add_persistent_information(self, clients, message):
-        clients = to_iterable(clients)
         if message:
-            for client in clients:
-                if client in self.persistent_information:
-                    message = f"{self.persistent_information[client]}\n\r{message}"
-                self.persistent_information[client] = message
+            for client in to_iterable(clients):
+                information = self.persistent_information.get(client)
+                information = message if information is None else f"{information}{SEPARATOR}{message}"
+                self.persistent_information[client] = information
+                self.client2header[client] = (information + SEPARATOR).encode("utf-8")
+                self.client2feed_header[client] = escape(information + SEPARATOR)
 
-    def clear_persistent_information(self):
-        self.persistent_information.clear()
+    def clear_persistent_information(self, clients=None):
+        """ Forget the persistent information of the clients, or of everyone if clients is None. """
+        if clients is None:
+            self.persistent_information.clear()
+            self.client2header.clear()
+            self.client2feed_header.clear()
+        else:
+            for client in to_iterable(clients):
+                self.persistent_information.pop(client, None)
+                self.client2header.pop(client, None)
+                self.client2feed_header.pop(client, None)
 
     def send_to_clients(self, clients, message):
-        clients = to_iterable(clients)
-        if message:
-            for client in clients:
-                client_message = message
-                if client in self.persistent_information:
-                    client_message = f"{self.persistent_information[client]}\n\r{message}"
-                try:
-                    client.sendall(str.encode(client_message))
-                except ConnectionResetError:
-                    pass
+        """ Send message to the clients, after their persistent information. Returns the number of bytes sent. """
+        if not message:
+            return 0
+        return self.send_encoded(clients, (message.encode("utf-8"),), message)
+
+    def send_encoded(self, clients, parts, message=None):
+        """ Send the text made of the encoded parts, after each client's persistent information.
+
+        Feed clients get it wrapped in a JSON text message. Returns the number of bytes sent.
+        """
+        bytes_sent = 0
+        feed_body = None
+        body = parts[0] if len(parts) == 1 else b"".join(parts)
+        large = len(body) >= SCATTER_MIN_BYTES
+        headers = self.client2header
+        feed_clients = self.feed_clients
+        for client in to_iterable(clients):
+            try:
+                if client in feed_clients:
+                    if feed_body is None:
+                        feed_body = escape(message if message is not None else b"".join(parts).decode("utf-8"))
+                    bytes_sent += send_parts(client, (FEED_TEXT_PREFIX, self.client2feed_header.get(client, b""), feed_body, FEED_TEXT_SUFFIX))
+                elif large:
+                    header = headers.get(client)
+                    bytes_sent += send_parts(client, parts if header is None else (header, *parts))
+                else:
+                    header = headers.get(client)
+                    data = body if header is None else header + body
+                    client.sendall(data)
+                    bytes_sent += len(data)
+            except OSError:
+                pass
+        return bytes_sent
+
+    def send_with_tails(self, body, client_tails):
+        """ Send the encoded body followed by each client's own encoded tail, for (client, tail) pairs.
+
+        This is send_encoded(client, (body, tail)) for each pair, without a call per client. The
+        publisher sends book snapshots this way, so clients that queue their messages get them with
+        send_snapshot, which replaces a snapshot they have not written yet. Returns the number of
+        bytes sent.
+        """
+        bytes_sent = 0
+        headers = self.client2header
+        feed_clients = self.feed_clients
+        for client, tail in client_tails:
+            if client in feed_clients:
+                bytes_sent += self.send_encoded(client, (body, tail))
+                continue
+            header = headers.get(client)
+            send_snapshot = getattr(client, "send_snapshot", None)
+            if send_snapshot is not None:
+                send_snapshot((body, tail) if header is None else (header, body, tail))
+                bytes_sent += len(body) + len(tail) + (len(header) if header is not None else 0)
+                continue
+            if len(body) + len(tail) >= SCATTER_MIN_BYTES:
+                bytes_sent += self.send_encoded(client, (body, tail))
+                continue
+            data = b"".join((body, tail) if header is None else (header, body, tail))
+            try:
+                client.sendall(data)
+                bytes_sent += len(data)
+            except OSError:
+                pass
+        return bytes_sent
+
+    def send_feed(self, clients, data):
+        """ Send encoded feed messages as they are. Returns the number of bytes sent. """
+        bytes_sent = 0
+        for client in to_iterable(clients):
+            try:
+                client.sendall(data)
+                bytes_sent += len(data)
+            except OSError:
+                pass
+        return bytes_sent
+
+    def forget(self, client):
+        """ Drop everything kept for a client that disconnected. """
+        self.clear_persistent_information([client])
+        self.feed_clients.discard(client)
@@ -0,0 +1,142 @@
+""" Level 2 market data feed for clients that send "subscribe".
+
+Subscribed clients get newline-delimited JSON instead of text:
+
+    {"type": "snapshot", "seq": 7, "bids": [[price, size], ...], "asks": [...], "info": ..., "status": ...}
+    {"type": "delta", "seq": 8, "levels": [["add", "bid", price, size], ...], "trades": [[price, size, "buy"], ...]}
+    {"type": "status", "text": ...}
+    {"type": "text", "text": ...}
+
+A snapshot carries the whole book, best price first, plus the client's persistent information and
+account/trades text. Deltas carry every level that was added, changed or deleted (size 0) and the
+trades printed since the previous message, tagged with the aggressor's side. Deltas are numbered;
+a client that sees a gap should send "subscribe" again to get a fresh snapshot. Status messages
+are sent when the client's own trades change, and any other server message is wrapped as text.
+"""
+import json
+
+from orderbook import format_levels
+
+SUBSCRIBE_COMMAND = "subscribe"
+SNAPSHOT_EVERY = 100
+
+
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class BookFeed:
+    """ Turns the changes to an OrderBook into numbered level deltas and trade prints.
+
+    A dark book publishes no levels and no trades, only empty snapshots.
+    """
+
+    def __init__(self, orderbook, is_dark=False):
+        self.orderbook = orderbook
+        self.is_dark = is_dark
+        self.sequence = 0
+        self.deltas_since_snapshot = 0
+        self.published = {}
+        self.next_trade_row = 0
+
+    def snapshot(self):
+        """ The whole book; deltas from here on are relative to it. """
+        bids = self.orderbook.bids
+        asks = self.orderbook.asks
+        bids.changed.clear()
+        asks.changed.clear()
+        self.published = {(True, price): size for price, size in bids.sizes()}
+        self.published.update({(False, price): size for price, size in asks.sizes()})
+        self.next_trade_row = len(self.orderbook.trade_log)
+        self.deltas_since_snapshot = 0
+        if self.is_dark:
+            return {"type": "snapshot", "seq": self.sequence, "bids": [], "asks": []}
+        return {"type": "snapshot", "seq": self.sequence, "bids": bids.sizes(), "asks": asks.sizes()}
+
+    def delta(self):
+        """ The changes since the last delta or snapshot, or None if nothing changed. """
+        if self.is_dark:
+            self.snapshot()
+            return None
+        levels = []
+        for side in (self.orderbook.bids, self.orderbook.asks):
+            for price in sorted(side.changed, reverse=side.is_bid):
+                key = (side.is_bid, price)
+                size = side.levels[price].size if price in side else 0
+                published_size = self.published.get(key, 0)
+                if size == published_size:
+                    continue
+                if size == 0:
+                    action = "delete"
+                    del self.published[key]
+                else:
+                    action = "add" if published_size == 0 else "change"
+                    self.published[key] = size
+                levels.append([action, "bid" if side.is_bid else "ask", price, size])
+            side.changed.clear()
+
+        log = self.orderbook.trade_log
+        trades = [
+            [log.price[row], log.size[row], "buy" if log.side[row] else "sell"]
+            for row in range(self.next_trade_row, len(log))
+        ]
+        self.next_trade_row = len(log)
+
+        if not levels and not trades:
+            return None
+        self.sequence += 1
+        self.deltas_since_snapshot += 1
+        return {"type": "delta", "seq": self.sequence, "levels": levels, "trades": trades}
+
+    def snapshot_due(self):
+        return self.deltas_since_snapshot >= SNAPSHOT_EVERY
+
+
+class LocalBook:
+    """ A client's copy of the server's book, kept up to date from feed messages. """
+
+    def __init__(self):
+        self.bids = {}
+        self.asks = {}
+        self.sequence = None
+        self.info = ""
+        self.status = ""
+
+    def in_sync(self):
+        return self.sequence is not None
+
+    def apply(self, message):
+        """ Apply one feed message. Returns True if the rendered view changed. """
+        kind = message.get("type")
+        if kind == "snapshot":
+            self.bids = dict(message["bids"])
+            self.asks = dict(message["asks"])
+            self.sequence = message["seq"]
+            self.info = message.get("info", "")
+            self.status = message.get("status", "")
+            return True
+        if kind == "delta":
+            if self.sequence is None or message["seq"] != self.sequence + 1:
+                self.sequence = None
+                return False
+            self.sequence = message["seq"]
+            for action, side, price, size in message["levels"]:
+                levels = self.bids if side == "bid" else self.asks
+                if action == "delete":
+                    levels.pop(price, None)
+                else:
+                    levels[price] = size
+            return bool(message["levels"])
+        if kind == "status":
+            changed = message["text"] != self.status
+            self.status = message["text"]
+            return changed
+        return False
+
+    def render(self):
+        bids = sorted(self.bids.items(), reverse=True)
+        asks = sorted(self.asks.items())
+        book = format_levels(bids, asks)
+        if self.info:
+            return f"{self.info}\n\r{book}{self.status}"
+        return book + self.status
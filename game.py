@@ -1,11 +1,56 @@
 import random
 import threading
-from orderbook import OrderBook
+from feed import SUBSCRIBE_COMMAND
+from journal import END, FILL, ORDER, QUOTE
+from marketdata import TopOfBook, best_level
+from metrics import ORDERS_ACCEPTED, ORDERS_REJECTED
+from orderbook import MAX_PRICE, OrderBook, in_range
+from publisher import Publisher
+
+QUOTE_SEPARATOR = "|"
+TRADES_COMMAND = "trades"
+
+
+def start_timer(delay, callback):
+    threading.Timer(delay, callback).start()
+
+
+def quote(orderbook, client, is_bid, size, price):
+    """ Move the client's bid or ask to price, or place one if they have none resting. """
+    client2order = orderbook.client2bid if is_bid else orderbook.client2ask
+    order_id = client2order.get(client)
+    if order_id is None or orderbook.update_order(client, order_id, size, price) is None:
+        client2order[client] = orderbook.add_order(client, is_bid, size, price)
+
+
+def parse_quote(message):
+    """ (bid size, bid, ask, ask size) from a mass quote such as "10@20|30@40", or None if message is not one.
+
+    Sizes and prices above orderbook.MAX_SIZE and MAX_PRICE are not accepted.
+    """
+    bid_side, separator, ask_side = message.partition(QUOTE_SEPARATOR)
+    bid_size, _, bid = bid_side.partition("@")
+    ask, _, ask_size = ask_side.partition("@")
+    fields = [field.strip() for field in (bid_size, bid, ask, ask_size)]
+    if not separator or not all(field.isdecimal() for field in fields):
+        return None
+    bid_size, bid, ask, ask_size = (int(field) for field in fields)
+    if not in_range(bid_size, bid) or not in_range(ask_size, ask):
+        return None
+    return bid_size, bid, ask, ask_size
 
 
 class Game:
-    def __init__(self, client_communicator):
+    def __init__(self, client_communicator, schedule=start_timer, publish_hz=0, journal=None, book_depth=None, rng=random):
         self.client_communicator = client_communicator
+        self.random = rng
+        self.schedule = schedule
+        self.book_depth = book_depth
+        self.publisher = Publisher(self, publish_hz)
+        self.journal = journal
+        self.journal_game = None
+        self.journaled_trades = 0
+        self.leaderboard = []
         self.started = False
         self.clients = set()
         self.client_to_id = {}
@@ -19,13 +64,13 @@ class Game:
         if not self.started:
             self.started = True
             self.client_to_secret.clear()
-            self.client_communicator.clear_persistent_information()
+            self.client_communicator.clear_persistent_information(self.clients.union(clients))
             self.client_to_id.clear()
 
-            self.clients = clients.copy()
+            self.clients = set(clients)
             client_id = 1
             for client in self.clients:
-                secret = random.randint(1, 10)
+                secret = self.random.randint(1, 10)
                 self.client_to_secret[client] = secret
                 self.client_to_id[client] = client_id
                 self.client_communicator.add_persistent_information(client, f"You are client {client_id} and your secret is {secret}")
@@ -34,6 +79,12 @@ class Game:
             self.market_open = True
             self.orderbook = OrderBook()
             self.orderbook_is_dark = orderbook_is_dark
+            self.publisher.reset()
+            if self.journal is not None:
+                self.journal_game = self.journal.start_game(self)
+                self.journaled_trades = 0
+            # Players and feed subscribers get the empty book straight away, not at their first order.
+            self.publisher.mark_dirty()
 
             self.schedule_game_end(duration)
             return True
@@ -42,58 +93,139 @@ class Game:
     def stop(self):
         if self.started:
             self.started = False
+            self.journal_end()
             return True
         return False
 
     def is_started(self):
         return self.started
 
+    def top_of_book(self):
+        """ The best levels, last trade price and number of trades of the current or last game's book. """
+        if self.orderbook is None:
+            return None
+        bid, bid_size = best_level(self.orderbook.bids)
+        ask, ask_size = best_level(self.orderbook.asks)
+        log = self.orderbook.trade_log
+        return TopOfBook(
+            bid if bid_size else None, bid_size, ask if ask_size else None, ask_size,
+            log.price[-1] if len(log) else None, len(log),
+        )
+
     def handle_message(self, client, message):
+        return self.handle_messages(client, [message])
+
+    def handle_messages(self, client, client_messages):
+        """ Apply a batch of commands from one client, publishing a single update for all of them. """
+        if SUBSCRIBE_COMMAND in client_messages:
+            self.client_communicator.subscribe_to_feed(client)
+            client_messages = [message for message in client_messages if message != SUBSCRIBE_COMMAND]
+            if client in self.clients and self.started:
+                self.publisher.subscribe(client)
+            if not client_messages:
+                return None
         if client not in self.clients:
             return [(client, "You are not part of a started game. Wait until one starts.")]
         else:
-            if not self.started:
-                return None
-            elif self.make_order(client, message):
-                messages = []
-                for client in self.clients:
-                    orderbook_status = self.orderbook.orders(is_dark=self.orderbook_is_dark) + self.orderbook.status(client)
-                    messages.append((client, orderbook_status))
-                return messages
+            replies = []
+            orders = 0
+            accepted = 0
+            for message in client_messages:
+                if message.startswith(TRADES_COMMAND):
+                    replies.append((client, self.trades_page(client, message[len(TRADES_COMMAND):].strip())))
+                elif self.started:
+                    orders += 1
+                    accepted += self.make_order(client, message)
+            if orders:
+                ORDERS_ACCEPTED.inc(accepted)
+                ORDERS_REJECTED.inc(orders - accepted)
+            if accepted:
+                self.publisher.mark_dirty()
+            return replies or None
+
+    def trades_page(self, client, page):
+        """ A page of the client's trades, the first one if page is empty. """
+        if page and not page.isdecimal():
+            return f"Type '{TRADES_COMMAND}' or '{TRADES_COMMAND} PAGE' to see your trades"
+        return self.orderbook.trades_page(client, int(page or 1))
+
+    def remove_client(self, client):
+        """ Cancel the orders of a client that disconnected and stop sending them updates.
+
+        Their trades stay in the book, so they are still settled when the game ends.
+        """
+        if client not in self.clients:
+            return
+        self.clients.discard(client)
+        self.publisher.forget(client)
+        if self.started and self.orderbook.cancel_client_orders(client):
+            if self.journal is not None:
+                for is_bid in (1, 0):
+                    self.journal.append(QUOTE, is_bid, self.journal_game, self.client_to_id[client], 0, 0, 0)
+            self.publisher.mark_dirty()
 
     def end_game(self):
         self.started = False
+        self.leaderboard = self.orderbook.leaderboard(self.fair_price, self.client_to_id)
+        self.journal_end()
         for client in self.clients:
             self.client_communicator.send_to_clients(
                 client,
-                self.orderbook.orders(is_dark=self.orderbook_is_dark)
+                self.orderbook.orders(is_dark=self.orderbook_is_dark, depth=self.book_depth)
                 + self.orderbook.status(client)
                 + self.orderbook.result(self.fair_price, self.client_to_id)
             )
 
     def schedule_game_end(self, duration):
-        threading.Timer(duration, self.end_game).start()
+        self.schedule(duration, self.end_game)
 
     def make_order(self, client, message):
-        if message[0] not in ['b', 's'] or not message[1:].isnumeric():
+        if QUOTE_SEPARATOR in message:
+            return self.make_quote(client, message)
+        if len(message) < 2 or message[0] not in ['b', 's'] or not message[1:].isdecimal():
             return False
 
+        is_bid = message[0] == 'b'
         price = int(message[1:])
+        if price > MAX_PRICE:
+            return False
+        quote(self.orderbook, client, is_bid, 1, price)
+        if self.journal is not None:
+            self.journal_order(client, is_bid, 1, price)
+        return True
 
-        if message[0] == 'b':
-            if client not in self.orderbook.client2bid:
-                order_id = self.orderbook.add_order(client, True, 1, price)
-                self.orderbook.client2bid[client] = order_id
-            else:
-                order_id = self.orderbook.client2bid[client]
-                self.orderbook.update_order(client, order_id, 1, price)
-
-        elif message[0] == 's':
-            if client not in self.orderbook.client2ask:
-                order_id = self.orderbook.add_order(client, False, 1, price)
-                self.orderbook.client2ask[client] = order_id
-            else:
-                order_id = self.orderbook.client2ask[client]
-                self.orderbook.update_order(client, order_id, 1, price)
-
+    def make_quote(self, client, message):
+        """ Replace the client's bid and ask with the sizes and prices of a mass quote. """
+        fields = parse_quote(message)
+        if fields is None:
+            return False
+        bid_size, bid, ask, ask_size = fields
+        if bid_size and ask_size and bid >= ask:
+            return False
+        self.orderbook.mass_quote(client, bid_size, bid, ask, ask_size)
+        if self.journal is not None:
+            client_id = self.client_to_id[client]
+            self.journal.append(QUOTE, 1, self.journal_game, client_id, 0, bid_size, bid)
+            self.journal.append(QUOTE, 0, self.journal_game, client_id, 0, ask_size, ask)
+            self.journal_fills()
         return True
+
+    def journal_end(self):
+        """ Journal the end of the game, once even if it was stopped before its end. """
+        if self.journal is not None and self.journal_game is not None:
+            self.journal.append(END, 0, self.journal_game, 0, 0, 0, self.fair_price)
+            self.journal_game = None
+
+    def journal_order(self, client, is_bid, size, price):
+        """ Journal an accepted order and the fills it caused. """
+        self.journal.append(ORDER, is_bid, self.journal_game, self.client_to_id[client], 0, size, price)
+        self.journal_fills()
+
+    def journal_fills(self):
+        """ Journal the fills since the last call. """
+        log = self.orderbook.trade_log
+        for row in range(self.journaled_trades, len(log)):
+            buyer = self.client_to_id.get(log.clients[log.buyer[row]], 0)
+            seller = self.client_to_id.get(log.clients[log.seller[row]], 0)
+            self.journal.append(FILL, log.side[row], self.journal_game, buyer, seller, log.size[row], log.price[row], log.timestamp[row])
+        self.journaled_trades = len(log)
@@ -0,0 +1,108 @@
+""" Append-only binary journal of every game: its players, the commands it accepted and its fills.
+
+Every record is RECORD.size bytes:
+
+    kind, side, game, client, other, size, price, timestamp
+
+START   a game began. size is the number of players, price the fair price and side 1 if the book was dark.
+PLAYER  client is a player's id in the game and price their secret.
+ORDER   client quoted price for size; side is 1 for a bid.
+QUOTE   client replaced both quotes at once: one record for the bid (side 1) followed by one for the ask.
+        A size of 0 pulls that side.
+FILL    client bought size at price from other; side is 1 if the buyer was the aggressor.
+END     the game ended and was settled at the fair price in price.
+
+Sizes and prices come from the order book, which keeps them within orderbook.MAX_SIZE and MAX_PRICE,
+well inside the int64 fields.
+
+Records are packed on the matching thread and written to disk by a background thread in batches.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+RECORD = struct.Struct("<BbIIIqqd")
+START, PLAYER, ORDER, FILL, END, QUOTE = range(1, 7)
+KIND_NAMES = {START: "start", PLAYER: "player", ORDER: "order", FILL: "fill", END: "end", QUOTE: "quote"}
+FLUSH_SECONDS = 0.05
+
+
+def read_journal(path):
+    """ Iterate over the records of a journal, unpacked straight from a memory map of the file. """
+    if os.path.getsize(path) < RECORD.size:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            # A crash can leave a partial record at the end.
+            yield from RECORD.iter_unpack(view[:len(view) - len(view) % RECORD.size])
+        finally:
+            view.release()
+
+
+def last_game_number(path):
+    if not os.path.exists(path):
+        return 0
+    return max((record[2] for record in read_journal(path) if record[0] == START), default=0)
+
+
+class Journal:
+    """ Writes journal records for the games of a server.
+
+    append only packs the record into a buffer; a writer thread hands the buffer to the file every
+    FLUSH_SECONDS, so the matching thread never waits for the disk. Game numbers carry on from
+    what is already in the file.
+    """
+
+    def __init__(self, path, flush_seconds=FLUSH_SECONDS):
+        self.path = path
+        self.games = last_game_number(path)
+        self.file = open(path, "ab")
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.pending = bytearray()
+        self.records = 0
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="journal", daemon=True)
+        self.thread.start()
+
+    def append(self, kind, side, game, client, other, size, price, timestamp=None):
+        record = RECORD.pack(kind, side, game, client, other, size, price, time.time() if timestamp is None else timestamp)
+        with self.lock:
+            self.pending += record
+            self.records += 1
+
+    def start_game(self, game):
+        """ Record the start of game and its players. Returns the game's number in the journal. """
+        with self.lock:
+            self.games += 1
+            number = self.games
+        self.append(START, game.orderbook_is_dark, number, 0, 0, len(game.clients), game.fair_price)
+        for client, client_id in game.client_to_id.items():
+            self.append(PLAYER, 0, number, client_id, 0, 0, game.client_to_secret[client])
+        return number
+
+    def run(self):
+        while not self.closed.wait(self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            data = self.pending
+            self.pending = bytearray()
+        if data:
+            try:
+                self.file.write(data)
+                self.file.flush()
+            except OSError:
+                LOG.exception(f"Writing {len(data) // RECORD.size} records to the journal {self.path} failed")
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
@@ -0,0 +1,131 @@
+""" Fills and top-of-book snapshots published by worker processes through shared memory rings.
+
+Every book has a number. A fill record is
+
+    book, game, price, size, aggressor_is_buy, buyer_id, seller_id, timestamp
+
+and a top-of-book record, written whenever the best levels change, is
+
+    book, game, bid, bid_size, ask, ask_size, timestamp
+
+where game counts the games started on the book and a size of 0 means the side is empty. Buyer and
+seller ids are the client ids of the game. Prices and sizes are within orderbook.MAX_PRICE and
+MAX_SIZE, so they fit the int64 fields.
+"""
+import time
+from collections import namedtuple
+
+from ringbuffer import RingBuffer
+
+FILL_FORMAT = "<IIqqBIId"
+TOP_FORMAT = "<IIqqqqd"
+FILL_CAPACITY = 65536
+TOP_CAPACITY = 4096
+
+TopOfBook = namedtuple("TopOfBook", "bid bid_size ask ask_size last_price trades")
+
+
+def best_level(side):
+    price = side.best_price()
+    if price is None:
+        return 0, 0
+    return price, side.levels[price].size
+
+
+class MarketDataWriter:
+    """ Publishes the fills and best levels of a worker's books after every batch. """
+
+    def __init__(self, fills_name, tops_name):
+        self.fills = RingBuffer(FILL_FORMAT, FILL_CAPACITY, fills_name)
+        self.tops = RingBuffer(TOP_FORMAT, TOP_CAPACITY, tops_name)
+        self.book2state = {}
+
+    def publish(self, book, game_number, game):
+        """ Write the fills and the top of book of game's OrderBook that changed since the last call. """
+        orderbook = game.orderbook
+        if orderbook is None:
+            return
+        state = self.book2state.get(book)
+        if state is None or state[0] is not orderbook:
+            state = self.book2state[book] = [orderbook, 0, None]
+
+        log = orderbook.trade_log
+        for row in range(state[1], len(log)):
+            self.fills.append(
+                book, game_number, log.price[row], log.size[row], log.side[row],
+                game.client_to_id.get(log.clients[log.buyer[row]], 0),
+                game.client_to_id.get(log.clients[log.seller[row]], 0),
+                log.timestamp[row],
+            )
+        state[1] = len(log)
+
+        top = best_level(orderbook.bids) + best_level(orderbook.asks)
+        if top != state[2]:
+            state[2] = top
+            self.tops.append(book, game_number, *top, time.time())
+
+    def forget(self, book):
+        self.book2state.pop(book, None)
+
+    def close(self):
+        self.fills.close()
+        self.tops.close()
+
+
+class MarketDataReader:
+    """ The front end's view of a worker's books, read from the rings it owns. """
+
+    def __init__(self):
+        self.fills = RingBuffer(FILL_FORMAT, FILL_CAPACITY)
+        self.tops = RingBuffer(TOP_FORMAT, TOP_CAPACITY)
+        self.fill_position = 0
+        self.top_position = 0
+        self.lost = 0
+        self.book2game = {}
+        self.book2top = {}
+        self.book2last_price = {}
+        self.book2trades = {}
+
+    def names(self):
+        return self.fills.name, self.tops.name
+
+    def _is_current(self, book, game_number):
+        """ Start tracking a new game on the book, and ignore records left over from earlier ones. """
+        current = self.book2game.get(book)
+        if current is not None and game_number < current:
+            return False
+        if game_number != current:
+            self.book2game[book] = game_number
+            self.book2top[book] = (0, 0, 0, 0)
+            self.book2last_price[book] = None
+            self.book2trades[book] = 0
+        return True
+
+    def poll(self):
+        fills, self.fill_position, lost_fills = self.fills.read(self.fill_position)
+        tops, self.top_position, lost_tops = self.tops.read(self.top_position)
+        self.lost += lost_fills + lost_tops
+        for book, game_number, price, size, _, _, _, _ in fills:
+            if self._is_current(book, game_number):
+                self.book2last_price[book] = price
+                self.book2trades[book] += 1
+        for book, game_number, bid, bid_size, ask, ask_size, _ in tops:
+            if self._is_current(book, game_number):
+                self.book2top[book] = (bid, bid_size, ask, ask_size)
+
+    def forget(self, book):
+        for book2value in (self.book2game, self.book2top, self.book2last_price, self.book2trades):
+            book2value.pop(book, None)
+
+    def top_of_book(self, book):
+        if book not in self.book2game:
+            return None
+        bid, bid_size, ask, ask_size = self.book2top[book]
+        return TopOfBook(
+            bid if bid_size else None, bid_size, ask if ask_size else None, ask_size,
+            self.book2last_price[book], self.book2trades[book],
+        )
+
+    def close(self):
+        self.fills.close()
+        self.tops.close()
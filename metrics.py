@@ -0,0 +1,168 @@
+""" Counters, gauges and histograms for the server, readable as Prometheus text.
+
+Recording is a few attribute updates and at most one bisect, cheap enough to stay on in
+production. Metrics are only ever updated from the matching thread, so they take no locks; a
+scrape from the HTTP thread may see a histogram halfway through an update, which is off by one
+sample at most.
+
+    python server.py --metrics-port 9100
+    curl localhost:9100/metrics
+"""
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOG = logging.getLogger(__name__)
+PREFIX = "market_making_game_"
+SECONDS_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 0.1, 1)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self):
+        return f"# HELP {self.name} {self.help_text}\n# TYPE {self.name} counter\n{self.name} {self.value}\n"
+
+    def summary(self):
+        return f"{self.name[len(PREFIX):]}={self.value}"
+
+
+class Gauge:
+    """ A value read when the metrics are collected, from function. """
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def value(self):
+        try:
+            return self.function()
+        except Exception:
+            LOG.exception(f"Reading {self.name} failed")
+            return float("nan")
+
+    def render(self):
+        return f"# HELP {self.name} {self.help_text}\n# TYPE {self.name} gauge\n{self.name} {self.value()}\n"
+
+    def summary(self):
+        return f"{self.name[len(PREFIX):]}={self.value()}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """ The upper bound of the bucket holding the q-th quantile, or None if nothing was observed. """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        s = f"# HELP {self.name} {self.help_text}\n# TYPE {self.name} histogram\n"
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            s += f'{self.name}_bucket{{le="{bound}"}} {cumulative}\n'
+        s += f'{self.name}_bucket{{le="+Inf"}} {self.count}\n'
+        s += f"{self.name}_sum {self.sum}\n{self.name}_count {self.count}\n"
+        return s
+
+    def summary(self):
+        if not self.count:
+            return f"{self.name[len(PREFIX):]}=0"
+        return f"{self.name[len(PREFIX):]}={self.count} mean {self.sum / self.count * 1e6:.1f}us p99<={self.quantile(0.99) * 1e6:g}us"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self._add(Counter(PREFIX + name, help_text))
+
+    def gauge(self, name, help_text, function):
+        return self._add(Gauge(PREFIX + name, help_text, function))
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        return self._add(Histogram(PREFIX + name, help_text, buckets))
+
+    def render(self):
+        """ Every metric in the Prometheus text exposition format. """
+        return "".join(metric.render() for metric in self.metrics.values())
+
+    def summary(self):
+        return ", ".join(metric.summary() for metric in self.metrics.values())
+
+
+REGISTRY = Registry()
+MESSAGES_RECEIVED = REGISTRY.counter("messages_received_total", "Commands received from clients")
+ORDERS_ACCEPTED = REGISTRY.counter("orders_accepted_total", "Orders accepted by Game.make_order")
+ORDERS_REJECTED = REGISTRY.counter("orders_rejected_total", "Commands Game.make_order did not accept")
+MATCH_SECONDS = REGISTRY.histogram("match_seconds", "Time spent matching one order in OrderBook._match")
+RENDER_SECONDS = REGISTRY.histogram("render_seconds", "Time spent rendering the book and statuses of one publisher flush")
+FAN_OUT_SECONDS = REGISTRY.histogram("fan_out_seconds", "Time spent sending one publisher flush to every client")
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """ Serve the metrics on http://host:port/metrics from a background thread. Returns the server. """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def start_log_dump(seconds, log=LOG, registry=REGISTRY):
+    """ Log a one line summary of the metrics every seconds. """
+
+    def dump():
+        while not stopped.wait(seconds):
+            log.info(f"Metrics: {registry.summary()}")
+
+    stopped = threading.Event()
+    threading.Thread(target=dump, name="metrics-log", daemon=True).start()
+    return stopped
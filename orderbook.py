@@ -1,217 +1,619 @@
+import bisect
 import logging
-from collections import namedtuple
+import time
+from array import array
+from collections import deque, namedtuple
+
+from metrics import MATCH_SECONDS
 
 LOG = logging.getLogger(__name__)
+# Prices and sizes end up in int64 columns: the trade log here, the journal and the market data
+# rings. Keeping them far below that bound also keeps level sizes and cash totals in range.
+MAX_PRICE = 10 ** 9
+MAX_SIZE = 10 ** 9
+STATUS_TRADES = 10
+TRADES_PAGE_SIZE = 50
 
 Trade = namedtuple("Trade", "is_buy size price")
 
 
+def _columns(trades):
+    """ The is_buy, size and price columns of a ClientTrades view or a list of Trade. """
+    if isinstance(trades, ClientTrades):
+        return trades.is_buy, trades.sizes(), trades.prices()
+    return [t.is_buy for t in trades], [t.size for t in trades], [t.price for t in trades]
+
+
+def _first_in_cash(is_buy, sizes, prices, buy_side, quantity):
+    cash = 0
+    for b, size, price in zip(is_buy, sizes, prices):
+        if quantity == 0:
+            break
+        if b == buy_side:
+            size = min(quantity, size)
+            cash += size * price
+            quantity -= size
+    return cash
+
+
 def position(trades):
-    pos = sum([t.size if t.is_buy else -t.size for t in trades])
+    is_buy, sizes, _ = _columns(trades)
+    pos = sum([size if b else -size for b, size in zip(is_buy, sizes)])
     return pos
 
 
 def realized_pnl(trades):
-    buys = sum([t.size for t in trades if t.is_buy])
-    sells = sum([t.size for t in trades if not t.is_buy])
+    is_buy, sizes, prices = _columns(trades)
+    buys = sum([size for b, size in zip(is_buy, sizes) if b])
+    sells = sum(sizes) - buys
     realized = min(buys, sells)
 
-    buy_cash = 0
-    buy_size_left = realized
-    for t in [t for t in trades if t.is_buy]:
-        size = min(buy_size_left, t.size)
-        buy_cash += size * t.price
-        buy_size_left -= size
+    buy_cash = _first_in_cash(is_buy, sizes, prices, True, realized)
+    sell_cash = _first_in_cash(is_buy, sizes, prices, False, realized)
+    return sell_cash - buy_cash
 
-    sell_cash = 0
-    sell_size_left = realized
-    for t in [t for t in trades if not t.is_buy]:
-        size = min(sell_size_left, t.size)
-        sell_cash += size * t.price
-        sell_size_left -= size
 
-    return sell_cash - buy_cash
+def _pair_off(lots, quantity):
+    """ Take quantity off the front of a queue of [size, price] lots and return its cash value. """
+    value = 0
+    while quantity:
+        lot = lots[0]
+        size = min(quantity, lot[0])
+        value += size * lot[1]
+        quantity -= size
+        lot[0] -= size
+        if lot[0] == 0:
+            lots.popleft()
+    return value
 
 
-def account_string(trades):
+def in_range(size, price):
+    """ Whether an order of size at price is within MAX_SIZE and MAX_PRICE. """
+    return 0 <= size <= MAX_SIZE and 0 <= price <= MAX_PRICE
+
+
+def rank(pnls):
+    """ (rank, client id, P/L) best first, from {client id: P/L}. Equal P/L share a rank. """
+    ranked = []
+    for place, (client_id, pnl) in enumerate(sorted(pnls.items(), key=lambda item: (-item[1], item[0])), 1):
+        ranked.append((ranked[-1][0] if ranked and ranked[-1][2] == pnl else place, client_id, pnl))
+    return ranked
+
+
+def leaderboard_string(ranked):
+    return "--- LEADERBOARD ---\n\r" + "".join(f"{place}. client {client_id}: {pnl}\n\r" for place, client_id, pnl in ranked)
+
+
+def account_string(account):
     s = "--- ACCOUNT ---\n\r"
-    s += "pos = {0}\n\rpnl = {1}\n\r".format(position(trades), realized_pnl(trades))
+    s += "pos = {0}\n\rpnl = {1}\n\r".format(account.position, account.realized_pnl)
     return s
 
 
-def trades_string(trades):
-    s = "--- TRADES ---\n\r"
-    for t in trades:
-        s += "{0} {1} @ {2}\n\r".format("Buy" if t.is_buy else "Sell", t.size, t.price)
-    return s
+def format_levels(bids, asks):
+    """ The order book text for (price, size) levels on each side, best price first. """
+    lines = ["--- ORDER BOOK ---\n\r"]
+    for level in range(max(len(bids), len(asks))):
+        bid = "{0:5} @ {1:5}".format(bids[level][1], bids[level][0]) if level < len(bids) else "             "
+        ask = "{0:<5} @ {1:<5}".format(asks[level][0], asks[level][1]) if level < len(asks) else ""
+        lines.append(f"{bid} | {ask}\n\r")
+    return "".join(lines)
+
+
+def trades_string(trades, header="--- TRADES ---"):
+    return header + "\n\r" + "".join("{0} {1} @ {2}\n\r".format("Buy" if t.is_buy else "Sell", t.size, t.price) for t in trades)
+
+
+class Account:
+    """ A client's running position and P/L, updated fill by fill.
+
+    Realized P/L matches realized_pnl: the first min(buys, sells) units bought are paired with
+    the first units sold. Lots not yet paired wait in a queue per side, so each fill costs
+    amortized O(1) however many trades came before it.
+    """
+
+    __slots__ = ("position", "buy_volume", "sell_volume", "cash", "realized_pnl", "_open_buys", "_open_sells")
+
+    def __init__(self):
+        self.position = 0
+        self.buy_volume = 0
+        self.sell_volume = 0
+        self.cash = 0
+        self.realized_pnl = 0
+        self._open_buys = deque()
+        self._open_sells = deque()
+
+    def add_fill(self, is_buy, size, price):
+        # Only one side has unpaired lots at a time and together they make up the position, so a
+        # fill pairs off against the other side up to the size of the position it reduces.
+        if is_buy:
+            paired = min(size, max(-self.position, 0))
+            self.position += size
+            self.buy_volume += size
+            self.cash -= size * price
+            self._open_buys.append([size, price])
+        else:
+            paired = min(size, max(self.position, 0))
+            self.position -= size
+            self.sell_volume += size
+            self.cash += size * price
+            self._open_sells.append([size, price])
+        if paired:
+            self.realized_pnl += _pair_off(self._open_sells, paired) - _pair_off(self._open_buys, paired)
+
+    def settle(self, true_price):
+        """ P/L after closing out the position at true_price. """
+        return self.cash + self.position * true_price
+
+
+EMPTY_ACCOUNT = Account()
+EMPTY_BOOK = format_levels([], [])
+
+
+class TradeLog:
+    """ Every fill in an order book, stored column-wise in typed arrays.
+
+    Row i is one fill. side is 1 when the aggressor bought, and buyer/seller are indices into
+    clients, so a row costs a few dozen bytes instead of a pair of namedtuples.
+    """
+
+    def __init__(self):
+        self.side = array("b")
+        self.size = array("q")
+        self.price = array("q")
+        self.buyer = array("l")
+        self.seller = array("l")
+        self.timestamp = array("d")
+        self.clients = []
+        self.client2index = {}
+
+    def __len__(self):
+        return len(self.size)
+
+    def client_index(self, client):
+        index = self.client2index.get(client)
+        if index is None:
+            index = self.client2index[client] = len(self.clients)
+            self.clients.append(client)
+        return index
+
+    def append(self, aggressor_is_buy, size, price, buyer, seller):
+        # Check before touching any column, so a bad fill cannot leave them different lengths.
+        if not in_range(size, price):
+            raise ValueError(f"Fill of {size} at {price} is out of range")
+        self.side.append(aggressor_is_buy)
+        self.size.append(size)
+        self.price.append(price)
+        self.buyer.append(self.client_index(buyer))
+        self.seller.append(self.client_index(seller))
+        self.timestamp.append(time.time())
+        return len(self.size) - 1
+
+
+class ClientTrades:
+    """ One client's trades: the rows of the trade log they took part in and their side in each. """
+
+    __slots__ = ("log", "rows", "is_buy")
+
+    def __init__(self, log):
+        self.log = log
+        self.rows = array("q")
+        self.is_buy = array("b")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        row = self.rows[i]
+        return Trade(bool(self.is_buy[i]), self.log.size[row], self.log.price[row])
+
+    def __iter__(self):
+        return self.range(0, len(self.rows))
+
+    def range(self, start, stop):
+        """ Iterate over the trades from start up to stop. """
+        log = self.log
+        rows = self.rows
+        is_buy = self.is_buy
+        for i in range(max(start, 0), min(stop, len(rows))):
+            row = rows[i]
+            yield Trade(bool(is_buy[i]), log.size[row], log.price[row])
+
+    def append(self, row, is_buy):
+        self.rows.append(row)
+        self.is_buy.append(is_buy)
+
+    def sizes(self):
+        size = self.log.size
+        return [size[row] for row in self.rows]
+
+    def prices(self):
+        price = self.log.price
+        return [price[row] for row in self.rows]
+
+
+class PriceLevel:
+    """ The orders resting at one price, in time priority.
+
+    Orders are linked into the queue through their own prev/next attributes, so appending,
+    popping the head and removing an order from the middle of the queue are all O(1).
+    """
+
+    def __init__(self, price):
+        self.price = price
+        self.head = None
+        self.tail = None
+        self.count = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        order = self.head
+        while order is not None:
+            yield order
+            order = order.next
+
+    def __contains__(self, order):
+        return order.level is self
+
+    def append(self, order):
+        order.level = self
+        order.prev = self.tail
+        order.next = None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next = order
+        self.tail = order
+        self.count += 1
+        self.size += order.size
+
+    def remove(self, order):
+        if order.prev is None:
+            self.head = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            self.tail = order.prev
+        else:
+            order.next.prev = order.prev
+        order.level = order.prev = order.next = None
+        self.count -= 1
+        self.size -= order.size
+
+    def reduce(self, order, size):
+        """ Take size off an order without touching its place in the queue. """
+        order.update(size=order.size - size)
+        self.size -= size
+
+
+class BookSide:
+    """ The price levels on one side of the order book.
+
+    Levels are kept in a dict keyed by price, and their prices are also kept in a sorted list,
+    updated with bisect when a level is added or emptied, so the best price is found in O(1) and
+    the best depth levels in O(depth) without scanning every level.
+
+    Every price whose level is added, resized or removed goes into changed, which the market
+    data feed drains to publish level deltas, and bumps version, which only ever goes up.
+    """
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self.levels = {}
+        self.changed = set()
+        self.version = 0
+        self._prices = []
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __contains__(self, price):
+        return price in self.levels
+
+    def __getitem__(self, price):
+        return self.levels[price]
+
+    def keys(self):
+        return self.levels.keys()
+
+    def best_price(self):
+        prices = self._prices
+        if not prices:
+            return None
+        return prices[-1] if self.is_bid else prices[0]
+
+    def prices(self, depth=None):
+        """ The prices with resting orders, best price first, all of them or the best depth. """
+        if depth is None:
+            return self._prices[::-1] if self.is_bid else self._prices.copy()
+        return self._prices[:-depth - 1:-1] if self.is_bid else self._prices[:depth]
+
+    def sizes(self, depth=None):
+        """ (price, size) for every level or the best depth, best price first. """
+        levels = self.levels
+        return [(price, levels[price].size) for price in self.prices(depth)]
+
+    def append(self, order):
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = PriceLevel(order.price)
+            bisect.insort(self._prices, order.price)
+        level.append(order)
+        self.changed.add(order.price)
+        self.version += 1
+
+    def remove(self, order):
+        level = order.level
+        if level is None:
+            return
+        level.remove(order)
+        self.changed.add(level.price)
+        self.version += 1
+        if len(level) == 0:
+            self._remove_level(level.price)
+
+    def reduce(self, order, size):
+        order.level.reduce(order, size)
+        self.changed.add(order.price)
+        self.version += 1
+
+    def _remove_level(self, price):
+        del self.levels[price]
+        prices = self._prices
+        del prices[bisect.bisect_left(prices, price)]
 
 
 class OrderBook:
 
     def __init__(self):
-        self.bids = {}
-        self.asks = {}
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.trade_log = TradeLog()
         self.client2trades = {}
+        self.client2account = {}
         self.client2bid = {}
         self.client2ask = {}
+        self.id2order = {}
+        self.next_valid_id = 1
+        self._depth2orders = {}
+
+    def version(self):
+        """ A number that goes up whenever an order is added to, changed in or removed from the book. """
+        return self.bids.version + self.asks.version
+
+    def orders(self, client=None, is_dark=True, depth=None):
+        """ The order book text, the best depth levels on each side or all of them.
 
-    def orders(self, client=None, is_dark=True):
-        bid_prices = sorted(self.bids.keys(), reverse=True)
-        ask_prices = sorted(self.asks.keys())
-        max_level = max(len(bid_prices), len(ask_prices))
-        s = "--- ORDER BOOK ---\n\r"
+        The text is kept and returned again until the book changes.
+        """
         if is_dark and client is None:
-            return s
-        for level in range(max_level):
-            if level < len(bid_prices):
-                bid_size = sum([o.size for o in self.bids[bid_prices[level]]])
-                s += "{0:5} @ {1:5}".format(bid_size, bid_prices[level])
-            else:
-                s += "             "
-            s += " | "
-            if level < len(ask_prices):
-                ask_size = sum([o.size for o in self.asks[ask_prices[level]]])
-                s += "{0:<5} @ {1:<5}".format(ask_prices[level], ask_size)
-            s += "\n\r"
-        return s
+            return EMPTY_BOOK
+        version = self.version()
+        cached = self._depth2orders.get(depth)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        book = format_levels(self.bids.sizes(depth), self.asks.sizes(depth))
+        self._depth2orders[depth] = (version, book)
+        return book
+
+    def status(self, client, last=STATUS_TRADES):
+        """ The client's account and their last trades, so the text stays the same size however long the game runs. """
+        account = account_string(self.client2account.get(client, EMPTY_ACCOUNT))
+        trades = self.client2trades.get(client)
+        if not trades:
+            return account + trades_string(())
+        count = len(trades)
+        if count <= last:
+            return account + trades_string(trades)
+        header = f"--- TRADES (last {last} of {count}, type 'trades PAGE' for the rest) ---"
+        return account + trades_string(trades.range(count - last, count), header)
 
-    def status(self, client):
-        trades = self.client2trades.get(client, [])
-        return account_string(trades) + trades_string(trades)
+    def trades_page(self, client, page, page_size=TRADES_PAGE_SIZE):
+        """ Page page, counting from 1, of the client's trades, oldest first. """
+        trades = self.client2trades.get(client)
+        if not trades:
+            return trades_string(())
+        pages = -(-len(trades) // page_size)
+        page = min(max(page, 1), pages)
+        start = (page - 1) * page_size
+        return trades_string(trades.range(start, start + page_size), f"--- TRADES page {page} of {pages} ---")
+
+    def settlement(self, true_price, client2id):
+        """ Each client id's P/L with their position closed out at true_price, in client2id order. """
+        return {
+            client_id: self.client2account.get(client, EMPTY_ACCOUNT).settle(true_price)
+            for client, client_id in client2id.items()
+        }
 
     def result(self, true_price, client2id):
         s = "--- RESULT ---\n\r"
-        for client, id in client2id.items():
-            trades = self.client2trades.get(client, [])
-            pos = sum([t.size if t.is_buy else -t.size for t in trades])
-            if pos != 0:
-                trades.append(Trade(pos < 0, abs(pos), true_price))
-            pnl = realized_pnl(trades)
-            s += f"P/L for client {client2id[client]}: {pnl}\n\r"
+        s += "".join(f"P/L for client {client_id}: {pnl}\n\r" for client_id, pnl in self.settlement(true_price, client2id).items())
         s += "\n\r"
         s += f"Fair price for the instrument was {true_price}\n\r"
         return s
 
+    def leaderboard(self, true_price, client2id):
+        """ The clients ranked by P/L, as (rank, client id, P/L). """
+        return rank(self.settlement(true_price, client2id))
+
+    def best_bid(self):
+        return self.bids.best_price()
+
+    def best_ask(self):
+        return self.asks.best_price()
+
     def add_order(self, client_id, is_bid, size, price):
         """ Add an order to the order book.
 
         Returns order_id upon success, otherwise None
         """
 
-        order = Order(client_id, is_bid, size, price)
+        if not in_range(size, price):
+            raise ValueError(f"Order of {size} at {price} is out of range")
+        order = Order(self.next_valid_id, client_id, is_bid, size, price)
+        self.next_valid_id += 1
+        start = time.perf_counter()
         self._match(order)
+        MATCH_SECONDS.observe(time.perf_counter() - start)
         if order.size == 0:
             return order.id
 
-        if is_bid:
-            self.bids.setdefault(price, []).append(order)
-            return order.id
-        else:
-            self.asks.setdefault(price, []).append(order)
-            return order.id
+        self.id2order[order.id] = order
+        self._side(order).append(order)
+        return order.id
 
     def update_order(self, client_id, order_id, size=None, price=None):
-        if order_id in Order.id2order.keys():
-            order = Order.id2order[order_id]
-            if order.is_bid:
-                if order.price in self.bids:
-                    if order in self.bids[order.price]:
-                        self.bids[order.price].remove(order)
-                    if len(self.bids[order.price]) == 0:
-                        del self.bids[order.price]
-                order.update(size=size, price=price)
-                self._match(order)
-                if order.size > 0:
-                    self.bids.setdefault(order.price, []).append(order)
-            else:
-                if order.price in self.asks:
-                    if order in self.asks[order.price]:
-                        self.asks[order.price].remove(order)
-                    if len(self.asks[order.price]) == 0:
-                        del self.asks[order.price]
-                order.update(size=size, price=price)
-                self._match(order)
-                if order.size > 0:
-                    self.asks.setdefault(order.price, []).append(order)
+        """ Amend a resting order, matching it again if it becomes marketable.
+
+        Returns order_id upon success, or None if the order is no longer in the book
+        """
+
+        if not in_range(0 if size is None else size, 0 if price is None else price):
+            raise ValueError(f"Order of {size} at {price} is out of range")
+        order = self.id2order.get(order_id)
+        if order is None:
+            return None
+        side = self._side(order)
+        if price in (None, order.price) and size is not None and 0 < size <= order.size:
+            # A resting order cannot become marketable without moving, and shrinking it keeps its place in the queue.
+            if size < order.size:
+                side.reduce(order, order.size - size)
+            return order_id
+        side.remove(order)
+        order.update(size=size, price=price)
+        start = time.perf_counter()
+        self._match(order)
+        MATCH_SECONDS.observe(time.perf_counter() - start)
+        if order.size > 0:
+            side.append(order)
+        else:
+            self._release(order)
+        return order_id
+
+    def mass_quote(self, client_id, bid_size, bid, ask, ask_size):
+        """ Replace the client's bid and ask in one go. A size of 0 pulls that side.
+
+        A side that keeps its price and does not grow is amended in place and keeps its place in
+        the queue. Both sides that move are pulled before either is entered again, so a new quote
+        never trades against the client's own quote it replaces.
+        """
+
+        requotes = []
+        for client2order, is_bid, size, price in ((self.client2bid, True, bid_size, bid), (self.client2ask, False, ask_size, ask)):
+            order = self.id2order.get(client2order.get(client_id))
+            if order is not None:
+                if order.price == price and 0 < size <= order.size:
+                    if size < order.size:
+                        self._side(order).reduce(order, order.size - size)
+                    continue
+                self._side(order).remove(order)
+                self._release(order)
+            if size > 0:
+                requotes.append((client2order, is_bid, size, price))
+        for client2order, is_bid, size, price in requotes:
+            order_id = self.add_order(client_id, is_bid, size, price)
+            if order_id in self.id2order:
+                client2order[client_id] = order_id
 
     def cancel_order(self, client_id, order_id):
-        if order_id in Order.id2order.keys():
-            order = Order.id2order[order_id]
-            if order.is_bid:
-                if order.price in self.bids:
-                    if order in self.bids[order.price]:
-                        self.bids[order.price].remove(order)
-                    if len(self.bids[order.price]) == 0:
-                        del self.bids[order.price]
-            else:
-                if order.price in self.asks:
-                    if order in self.asks[order.price]:
-                        self.asks[order.price].remove(order)
-                    if len(self.asks[order.price]) == 0:
-                        del self.asks[order.price]
+        """ Remove a resting order from the book.
+
+        Returns order_id upon success, or None if the order is no longer in the book
+        """
+
+        order = self.id2order.get(order_id)
+        if order is None:
+            return None
+        self._side(order).remove(order)
+        self._release(order)
+        return order_id
+
+    def cancel_client_orders(self, client_id):
+        """ Cancel the client's bid and ask. Returns the number of orders cancelled. """
+        cancelled = 0
+        for client2order in (self.client2bid, self.client2ask):
+            order_id = client2order.get(client_id)
+            if order_id is not None and self.cancel_order(client_id, order_id) is not None:
+                cancelled += 1
+        return cancelled
+
+    def _side(self, order):
+        return self.bids if order.is_bid else self.asks
+
+    def _release(self, order):
+        """ Forget an order that has left the book, filled or cancelled. """
+        del self.id2order[order.id]
+        client2order = self.client2bid if order.is_bid else self.client2ask
+        if client2order.get(order.client_id) == order.id:
+            del client2order[order.client_id]
 
     def _match(self, order):
         fills = []
         if order.is_bid:
-            while True:
-                if len(self.asks) == 0 or order.size == 0:
-                    break
-                min_ask = min(self.asks.keys())
-                if order.price >= min_ask:
-                    for opposite_order in self.asks[min_ask]:
-                        if order.size >= opposite_order.size:
-                            self.asks[min_ask].remove(opposite_order)
-                            if len(self.asks[min_ask]) == 0:
-                                del self.asks[min_ask]
-                            fills.append((order, opposite_order, opposite_order.size, min_ask))
-                            order.update(size=order.size - opposite_order.size)
-                        else:
-                            fills.append((order, opposite_order, order.size, min_ask))
-                            opposite_order.update(size=opposite_order.size - order.size)
-                            order.update(size=0)
-                            break
-                else:
-                    break
+            opposite_side = self.asks
         else:
-            while True:
-                if len(self.bids) == 0 or order.size == 0:
-                    break
-                max_bid = max(self.bids.keys())
-                if order.price <= max_bid:
-                    for opposite_order in self.bids[max_bid]:
-                        if order.size >= opposite_order.size:
-                            self.bids[max_bid].remove(opposite_order)  #  TODO: Remove order from Order.id2order
-                            if len(self.bids[max_bid]) == 0:
-                                del self.bids[max_bid]
-                            fills.append((opposite_order, order, opposite_order.size, max_bid))
-                            order.update(size=order.size - opposite_order.size)
-                        else:
-                            fills.append((opposite_order, order, order.size, max_bid))
-                            opposite_order.update(size=opposite_order.size - order.size)
-                            order.update(size=0)
-                            break
+            opposite_side = self.bids
+        while order.size > 0:
+            best_price = opposite_side.best_price()
+            if best_price is None:
+                break
+            if order.is_bid and order.price < best_price or not order.is_bid and order.price > best_price:
+                break
+            level = opposite_side[best_price]
+            while order.size > 0 and level.head is not None:
+                opposite_order = level.head
+                size = min(order.size, opposite_order.size)
+                if size == opposite_order.size:
+                    opposite_side.remove(opposite_order)
+                    self._release(opposite_order)
                 else:
-                    break
-        self.handle_fills(fills)
+                    opposite_side.reduce(opposite_order, size)
+                fills.append(self._fill(order, opposite_order, size, best_price))
+                order.update(size=order.size - size)
+        self.handle_fills(fills, order.is_bid)
+
+    @staticmethod
+    def _fill(order, opposite_order, size, price):
+        if order.is_bid:
+            return order, opposite_order, size, price
+        return opposite_order, order, size, price
 
-    def handle_fills(self, fills):
+    def handle_fills(self, fills, aggressor_is_buy=True):
         for buy_order, sell_order, size, price in fills:
-            self.client2trades.setdefault(buy_order.client_id, []).append(Trade(True, size, price))
-            self.client2trades.setdefault(sell_order.client_id, []).append(Trade(False, size, price))
+            row = self.trade_log.append(aggressor_is_buy, size, price, buy_order.client_id, sell_order.client_id)
+            self._client_trades(buy_order.client_id).append(row, True)
+            self._client_trades(sell_order.client_id).append(row, False)
+            self._account(buy_order.client_id).add_fill(True, size, price)
+            self._account(sell_order.client_id).add_fill(False, size, price)
+
+    def _client_trades(self, client):
+        trades = self.client2trades.get(client)
+        if trades is None:
+            trades = self.client2trades[client] = ClientTrades(self.trade_log)
+        return trades
+
+    def _account(self, client):
+        account = self.client2account.get(client)
+        if account is None:
+            account = self.client2account[client] = Account()
+        return account
 
 
 class Order:
-    next_valid_id = 1
-    id2order = {}
+    __slots__ = ("id", "client_id", "is_bid", "size", "price", "level", "prev", "next")
 
-    def __init__(self, client_id, is_bid, size, price):
+    def __init__(self, order_id, client_id, is_bid, size, price):
+        self.id = order_id
         self.client_id = client_id
         self.is_bid = is_bid
         self.size = size
         self.price = price
-        Order.next_valid_id += 1
-        self.id = Order.next_valid_id
-        Order.id2order[self.id] = self
+        self.level = None
+        self.prev = None
+        self.next = None
 
     def update(self, size=None, price=None):
         if size is not None:
@@ -0,0 +1,143 @@
+""" A sampling profiler for the running server, started and stopped from the console.
+
+A background thread looks at the stack of every other thread INTERVAL_SECONDS apart, so the
+matching thread, the event loop and every client handler are covered without touching their code.
+Threads that are only waiting are left out, so the samples show where CPU goes. A C call such as
+recv, SimpleQueue.get or epoll has no frame of its own, so a thread counts as waiting when its
+innermost frame is at a line of a waiting function that calls one of BLOCKING_CALLS; the rest of
+that function's time is kept. stop writes the samples either as collapsed stacks, one
+"thread;caller;callee count" line per stack for flame graph tools, or, for a file ending in
+.pstats, as a pstats file that python -m pstats or snakeviz can read. In a pstats file the call
+counts are sample counts.
+
+    profile start
+    profile stop matching.folded
+"""
+import collections
+import dis
+import marshal
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+INTERVAL_SECONDS = 0.01
+PSTATS_SUFFIX = ".pstats"
+WAITING = {threading.Condition.wait.__code__, selectors.DefaultSelector.select.__code__, socket.socket.accept.__code__}
+BLOCKING_CALLS = {"recv", "recv_into", "accept", "_accept", "get", "wait", "acquire", "poll", "select", "sendall", "sendmsg", "sleep"}
+
+
+def function_name(code):
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def pstats_key(code):
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def blocking_lines(code):
+    """ The lines of code that call one of BLOCKING_CALLS. """
+    lines = set()
+    line = code.co_firstlineno
+    for instruction in dis.get_instructions(code):
+        positions = getattr(instruction, "positions", None)
+        start = positions.lineno if positions is not None else instruction.starts_line
+        if start:
+            line = start
+        if instruction.opname in ("LOAD_ATTR", "LOAD_METHOD") and instruction.argval in BLOCKING_CALLS:
+            lines.add(line)
+    return lines
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval=INTERVAL_SECONDS, waiting=()):
+        self.interval = interval
+        self.waiting = {code: blocking_lines(code) for code in WAITING.union(waiting)}
+        self.samples = collections.Counter()
+        self.sample_count = 0
+        self.ignored = set()
+        self.thread = None
+        self._stopped = threading.Event()
+
+    def is_running(self):
+        return self.thread is not None
+
+    def start(self):
+        """ Start sampling every thread but the calling one, normally the console. """
+        if self.thread is not None:
+            return False
+        self.samples.clear()
+        self.sample_count = 0
+        self._stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.ignored = {threading.get_ident()}
+        self.thread.start()
+        self.ignored.add(self.thread.ident)
+        return True
+
+    def stop(self, path=None):
+        """ Stop sampling and write the samples to path, if one is given. """
+        if self.thread is None:
+            return False
+        self._stopped.set()
+        self.thread.join()
+        self.thread = None
+        if path is not None:
+            self.write(path)
+        return True
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in self.ignored or frame.f_lineno in self.waiting.get(frame.f_code, ()):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.samples[names.get(ident, "thread"), tuple(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def write(self, path):
+        if path.endswith(PSTATS_SUFFIX):
+            with open(path, "wb") as file:
+                marshal.dump(self.pstats(), file)
+        else:
+            with open(path, "w") as file:
+                file.write(self.collapsed())
+
+    def collapsed(self):
+        lines = []
+        for (thread_name, stack), count in self.samples.most_common():
+            lines.append(";".join([thread_name] + [function_name(code) for code in stack]) + f" {count}\n")
+        return "".join(lines)
+
+    def pstats(self):
+        """ The samples in the format pstats.Stats loads: {function: (cc, nc, tt, ct, callers)}. """
+        own = collections.Counter()
+        total = collections.Counter()
+        callers = collections.defaultdict(collections.Counter)
+        for (_, stack), count in self.samples.items():
+            own[stack[-1]] += count
+            for code in set(stack):
+                total[code] += count
+            for caller, callee in zip(stack, stack[1:]):
+                callers[callee][caller] += count
+        stats = {}
+        for code, count in total.items():
+            stats[pstats_key(code)] = (
+                count, count, own[code] * self.interval, count * self.interval,
+                {pstats_key(caller): (n, n, 0.0, n * self.interval) for caller, n in callers[code].items()},
+            )
+        return stats
+
+
+def default_path():
+    return time.strftime("profile-%Y%m%d-%H%M%S.folded")
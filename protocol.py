@@ -0,0 +1,64 @@
+import socket
+
+FRAMINGS = ["lines", "none"]
+MAX_COMMAND_LENGTH = 256
+HEARTBEAT_SECONDS = 10
+HEARTBEAT_PROBES = 3
+
+
+class LineParser:
+    """ Splits a newline-delimited byte stream into commands, however TCP happens to chunk it.
+
+    A read may hold several commands or only part of one; the unfinished tail is kept until the
+    rest arrives. A tail that grows past MAX_COMMAND_LENGTH without a newline is garbage and is
+    thrown away.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        if b"\n" not in data:
+            if len(self.buffer) > MAX_COMMAND_LENGTH:
+                self.buffer.clear()
+            return []
+        *lines, tail = self.buffer.split(b"\n")
+        self.buffer = bytearray(tail)
+        commands = []
+        for line in lines:
+            command = line.decode("utf-8", "replace").strip()
+            if command:
+                commands.append(command)
+        return commands
+
+
+class RawParser:
+    """ Compatibility mode for unframed clients: every read is taken to be exactly one command. """
+
+    def feed(self, data):
+        command = data.decode("utf-8", "replace").strip()
+        return [command] if command else []
+
+
+def new_parser(framing):
+    if framing == "lines":
+        return LineParser()
+    return RawParser()
+
+
+def enable_heartbeats(connection, seconds=HEARTBEAT_SECONDS, probes=HEARTBEAT_PROBES):
+    """ Have the OS probe the peer of an idle connection every seconds.
+
+    A client that vanished without closing its connection (a half-open connection) then makes recv
+    fail after about seconds * (probes + 1), and a send it never acknowledges fails as quickly,
+    instead of both waiting forever. The probes are TCP keepalives, so clients need no changes.
+    """
+    if connection.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    options = [("TCP_KEEPIDLE", seconds), ("TCP_KEEPINTVL", seconds), ("TCP_KEEPCNT", probes), ("TCP_USER_TIMEOUT", seconds * (probes + 1) * 1000)]
+    for name, value in options:
+        option = getattr(socket, name, None)
+        if option is not None:
+            connection.setsockopt(socket.IPPROTO_TCP, option, max(1, int(value)))
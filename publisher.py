@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+
+from feed import BookFeed, encode
+from metrics import FAN_OUT_SECONDS, RENDER_SECONDS
+
+LOG = logging.getLogger(__name__)
+
+
+class Publisher:
+    """ Sends order book and account updates to the clients of a game, at most publish_hz times a second.
+
+    Changes only mark the game dirty and schedule a flush. A flush renders the order book once,
+    reuses it for every client and skips clients whose view is unchanged since the last update they
+    were sent. A publish_hz of 0 flushes straight away on every change.
+
+    Clients subscribed to the feed get one shared delta per flush instead of the rendered book,
+    and a snapshot of their own when they subscribe, at the start of a game and every
+    SNAPSHOT_EVERY deltas.
+    """
+
+    def __init__(self, game, publish_hz=0):
+        self.game = game
+        self.publish_hz = publish_hz
+        self.lock = threading.Lock()
+        self.flush_pending = False
+        self.last_flush_time = 0
+        self.last_book = None
+        self.client2trade_count = {}
+        self.client2status = {}
+        self.client2status_bytes = {}
+        self.feed = None
+        self.feed_clients_in_sync = set()
+        self.flushes = 0
+        self.bytes_sent = 0
+        self.render_seconds = 0
+
+    def reset(self):
+        self.last_book = None
+        self.client2trade_count.clear()
+        self.client2status.clear()
+        self.client2status_bytes.clear()
+        self.feed = BookFeed(self.game.orderbook, self.game.orderbook_is_dark)
+        self.feed_clients_in_sync.clear()
+
+    def forget(self, client):
+        """ Drop the views kept for a client that left the game. """
+        self.client2trade_count.pop(client, None)
+        self.client2status.pop(client, None)
+        self.client2status_bytes.pop(client, None)
+        self.feed_clients_in_sync.discard(client)
+
+    def subscribe(self, client):
+        """ Send the client a fresh snapshot with the next flush. """
+        self.feed_clients_in_sync.discard(client)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        if not self.publish_hz:
+            self.flush()
+            return
+        with self.lock:
+            if self.flush_pending:
+                return
+            self.flush_pending = True
+        delay = max(0, self.last_flush_time + 1 / self.publish_hz - time.monotonic())
+        self.game.schedule(delay, self.flush)
+
+    def flush(self):
+        with self.lock:
+            self.flush_pending = False
+            self.last_flush_time = time.monotonic()
+        game = self.game
+        if not game.started:
+            return
+
+        start = time.perf_counter()
+        communicator = game.client_communicator
+        orderbook = game.orderbook
+        book = orderbook.orders(is_dark=game.orderbook_is_dark, depth=game.book_depth)
+        book_changed = book != self.last_book
+        self.last_book = book
+        updates = []
+        feed_updates = []
+        feed_clients = [client for client in game.clients if communicator.is_feed_client(client)]
+        if feed_clients:
+            feed_updates = self._feed_updates(feed_clients)
+        for client in game.clients:
+            trade_count = len(orderbook.client2trades.get(client, ()))
+            if self.client2trade_count.get(client) == trade_count and (not book_changed or client in self.feed_clients_in_sync):
+                continue
+            if client in self.feed_clients_in_sync:
+                feed_updates.append((client, encode({"type": "status", "text": self._status(client, trade_count)})))
+            elif not communicator.is_feed_client(client):
+                self._status(client, trade_count)
+                updates.append((client, self.client2status_bytes[client]))
+        render_seconds = time.perf_counter() - start
+        RENDER_SECONDS.observe(render_seconds)
+
+        start = time.perf_counter()
+        bytes_sent = 0
+        if updates:
+            bytes_sent += communicator.send_with_tails(book.encode("utf-8"), updates)
+        for clients, data in feed_updates:
+            bytes_sent += communicator.send_feed(clients, data)
+        FAN_OUT_SECONDS.observe(time.perf_counter() - start)
+        self.flushes += 1
+        self.bytes_sent += bytes_sent
+        self.render_seconds += render_seconds
+        LOG.debug(f"Flushed {len(updates)} of {len(game.clients)} clients: {bytes_sent} bytes, rendered in {render_seconds * 1000:.3f} ms")
+
+    def _feed_updates(self, feed_clients):
+        """ The shared delta for clients in sync, and a snapshot for each client that is not. """
+        orderbook = self.game.orderbook
+        delta = self.feed.delta()
+        if self.feed.snapshot_due():
+            self.feed_clients_in_sync.clear()
+        in_sync = [client for client in feed_clients if client in self.feed_clients_in_sync]
+        out_of_sync = [client for client in feed_clients if client not in self.feed_clients_in_sync]
+        updates = []
+        if delta is not None and in_sync:
+            updates.append((in_sync, encode(delta)))
+        if out_of_sync:
+            snapshot = self.feed.snapshot()
+            for client in out_of_sync:
+                trade_count = len(orderbook.client2trades.get(client, ()))
+                snapshot["info"] = self.game.client_communicator.persistent_information.get(client, "")
+                snapshot["status"] = self._status(client, trade_count)
+                updates.append((client, encode(snapshot)))
+                self.feed_clients_in_sync.add(client)
+        return updates
+
+    def _status(self, client, trade_count):
+        if self.client2trade_count.get(client) != trade_count:
+            self.client2trade_count[client] = trade_count
+            self.client2status[client] = self.game.orderbook.status(client)
+            self.client2status_bytes[client] = self.client2status[client].encode("utf-8")
+        return self.client2status[client]
@@ -0,0 +1,125 @@
+""" Rebuild the games in a journal written with server.py --journal, for audits and post-mortems.
+
+    python replay.py market-making-game.journal
+    python replay.py market-making-game.journal --game 3 --rebuild-book
+
+P/L comes straight from the cash and position the journaled fills add up to. With --rebuild-book the accepted orders are also
+matched again in a fresh OrderBook, which prints the final book and checks that matching them gives
+the same fills as the journal.
+"""
+import argparse
+import time
+
+from game import quote
+from journal import END, FILL, ORDER, PLAYER, QUOTE, START, read_journal
+from orderbook import OrderBook, format_levels, rank
+
+
+class GameReplay:
+    def __init__(self, number, player_count, fair_price, is_dark, rebuild_book):
+        self.number = number
+        self.player_count = player_count
+        self.fair_price = fair_price
+        self.is_dark = is_dark
+        self.client2secret = {}
+        self.client2position = {}
+        self.client2cash = {}
+        self.orders = 0
+        self.fill_count = 0
+        self.fills = []
+        self.ended = False
+        self.orderbook = OrderBook() if rebuild_book else None
+
+    def add_player(self, client_id, secret):
+        self.client2secret[client_id] = secret
+        self.client2position.setdefault(client_id, 0)
+        self.client2cash.setdefault(client_id, 0)
+
+    def pnl(self, client_id):
+        return self.client2cash.get(client_id, 0) + self.client2position.get(client_id, 0) * self.fair_price
+
+    def fills_match(self):
+        """ Whether matching the journaled orders again gives the journaled fills. """
+        log = self.orderbook.trade_log
+        rebuilt = [(log.clients[log.buyer[row]], log.clients[log.seller[row]], log.size[row], log.price[row]) for row in range(len(log))]
+        return rebuilt == self.fills
+
+    def result(self):
+        s = f"--- GAME {self.number} ---\n"
+        s += f"{self.player_count} players, {self.orders} orders, {self.fill_count} fills{'' if self.ended else ', did not end'}\n"
+        for place, client_id, pnl in rank({client_id: self.pnl(client_id) for client_id in self.client2secret}):
+            s += f"{place}. P/L for client {client_id}: {pnl} (secret {self.client2secret[client_id]}, pos {self.client2position[client_id]})\n"
+        s += f"Fair price for the instrument was {self.fair_price}\n"
+        if self.orderbook is not None:
+            s += format_levels(self.orderbook.bids.sizes(), self.orderbook.asks.sizes()).replace("\n\r", "\n")
+            s += f"Fills {'match' if self.fills_match() else 'DO NOT match'} the journal\n"
+        return s
+
+
+def replay(path, games=None, rebuild_book=False):
+    """ Replay the journal at path, or only the given game numbers. Returns the games by number and the number of records read. """
+    number2game = {}
+    records = 0
+    # Records of one game mostly come in runs, so keep the last game at hand.
+    number = game = None
+    for kind, side, record_number, client, other, size, price, _ in read_journal(path):
+        records += 1
+        if record_number != number:
+            number = record_number
+            game = number2game.get(number) if games is None or number in games else None
+        if kind == FILL:
+            if game is None:
+                continue
+            position = game.client2position
+            cash = game.client2cash
+            position[client] = position.get(client, 0) + size
+            position[other] = position.get(other, 0) - size
+            cash[client] = cash.get(client, 0) - size * price
+            cash[other] = cash.get(other, 0) + size * price
+            game.fill_count += 1
+            if rebuild_book:
+                game.fills.append((client, other, size, price))
+        elif kind == ORDER:
+            if game is None:
+                continue
+            game.orders += 1
+            if rebuild_book:
+                quote(game.orderbook, client, bool(side), size, price)
+        elif kind == QUOTE:
+            if game is None:
+                continue
+            if side:
+                bid_size, bid = size, price
+            else:
+                game.orders += 1
+                if rebuild_book:
+                    game.orderbook.mass_quote(client, bid_size, bid, price, size)
+        elif kind == START:
+            if games is None or number in games:
+                game = number2game[number] = GameReplay(number, size, price, bool(side), rebuild_book)
+        elif game is None:
+            continue
+        elif kind == PLAYER:
+            game.add_player(client, price)
+        elif kind == END:
+            game.ended = True
+    return number2game, records
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("journal", help="Journal file written by the server")
+    parser.add_argument("--game", help="Only replay this game, can be repeated", type=int, action="append")
+    parser.add_argument("--rebuild-book", help="Match the orders again and check the fills against the journal", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    number2game, records = replay(args.journal, set(args.game) if args.game else None, args.rebuild_book)
+    seconds = time.perf_counter() - start
+    for game in number2game.values():
+        print(game.result())
+    print(f"Replayed {records} records in {seconds:.3f} seconds ({records / max(seconds, 1e-9):,.0f} records/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+""" Fixed size records in shared memory, written by one process and read by others. """
+import struct
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+HEADER = struct.Struct("<Q")
+STAMP = struct.Struct("<Q")
+
+
+class RingBuffer:
+    """ A ring of struct records in a multiprocessing.shared_memory block.
+
+    The header counts every record ever written and record n lives in slot n % capacity. There is
+    one writer; readers keep their own position and unpack records straight out of the shared
+    block, so nothing is pickled or sent through a pipe. A reader that falls more than capacity
+    records behind loses the oldest ones.
+
+    Every slot starts with a stamp, n + 1 once record n is complete and 0 while it is being
+    written, as in a seqlock. Stamps only go up, so a reader that finds record n's stamp still at
+    n + 1 after unpacking it knows the writer did not touch the slot meanwhile. Otherwise the
+    record counts as lost, and a torn record is never returned.
+
+    The process that creates the ring owns it and unlinks it on close, others attach by name.
+    """
+
+    def __init__(self, record_format, capacity, name=None):
+        self.record = struct.Struct(record_format)
+        self.slot_size = STAMP.size + self.record.size
+        self.capacity = capacity
+        self.owner = name is None
+        if self.owner:
+            self.shm = SharedMemory(create=True, size=HEADER.size + capacity * self.slot_size)
+            HEADER.pack_into(self.shm.buf, 0, 0)
+        else:
+            self.shm = SharedMemory(name=name)
+            # Only the owner may unlink the block; before Python 3.13 attaching registers it too.
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.buffer = self.shm.buf
+        self.written = HEADER.unpack_from(self.buffer, 0)[0]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _offset(self, n):
+        return HEADER.size + (n % self.capacity) * self.slot_size
+
+    def append(self, *values):
+        offset = self._offset(self.written)
+        STAMP.pack_into(self.buffer, offset, 0)
+        self.record.pack_into(self.buffer, offset + STAMP.size, *values)
+        self.written += 1
+        STAMP.pack_into(self.buffer, offset, self.written)
+        HEADER.pack_into(self.buffer, 0, self.written)
+
+    def read(self, position):
+        """ The records written since position, the position to read from next and how many were lost. """
+        buffer = self.buffer
+        record = self.record
+        end = HEADER.unpack_from(buffer, 0)[0]
+        records = []
+        for n in range(max(position, end - self.capacity), end):
+            offset = self._offset(n)
+            values = record.unpack_from(buffer, offset + STAMP.size)
+            # Keep the record only if nothing was written to its slot before or while unpacking it.
+            if STAMP.unpack_from(buffer, offset)[0] == n + 1:
+                records.append(values)
+        return records, end, end - position - len(records)
+
+    def close(self):
+        self.buffer = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
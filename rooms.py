@@ -0,0 +1,147 @@
+""" Rooms let one server run many games at once, each with its own OrderBook.
+
+Every connected client is in exactly one room: the default room until they send "join <room>".
+A room is created the first time someone joins it, and the console starts and stops the game in
+each room separately. Besides the default room there are at most MAX_ROOMS rooms, and a room is
+dropped as soon as nobody is in it and it has no game running.
+"""
+DEFAULT_ROOM = "main"
+JOIN_COMMAND = "join"
+MAX_ROOM_NAME_LENGTH = 32
+MAX_ROOMS = 64
+
+
+def parse_room_name(message):
+    """ The room in a "join <room>" command, or None if the name is missing or invalid. """
+    name = message[len(JOIN_COMMAND):].strip()
+    if not name or len(name) > MAX_ROOM_NAME_LENGTH or not name.isprintable() or " " in name:
+        return None
+    return name
+
+
+def is_join_command(message):
+    return message == JOIN_COMMAND or message.startswith(JOIN_COMMAND + " ")
+
+
+class Room:
+    def __init__(self, name, game):
+        self.name = name
+        self.game = game
+        self.clients = set()
+
+
+class GameRegistry:
+    """ The rooms of a server and the clients in each of them.
+
+    new_game(name) creates the game of a new room. It can return a Game, or anything with the same
+    start, stop, is_started, handle_messages and remove_client methods, such as a game hosted by a
+    worker process. drop_game(name), if given, is called when a room is dropped.
+    """
+
+    def __init__(self, new_game, drop_game=None, max_rooms=MAX_ROOMS):
+        self.new_game = new_game
+        self.drop_game = drop_game
+        self.max_rooms = max_rooms
+        self.rooms = {}
+        self.client2room = {}
+
+    def room(self, name=DEFAULT_ROOM):
+        """ The room called name, created if there is none. None if that would make too many rooms. """
+        room = self.rooms.get(name)
+        if room is None:
+            if name != DEFAULT_ROOM and self._room_count() >= self.max_rooms:
+                for idle_room in [idle_room for idle_room in self.rooms.values() if self._is_idle(idle_room)]:
+                    self._drop(idle_room)
+                if self._room_count() >= self.max_rooms:
+                    return None
+            room = self.rooms[name] = Room(name, self.new_game(name))
+        return room
+
+    def _room_count(self):
+        return len(self.rooms) - (DEFAULT_ROOM in self.rooms)
+
+    @staticmethod
+    def _is_idle(room):
+        return room.name != DEFAULT_ROOM and not room.clients and not room.game.is_started()
+
+    def _drop(self, room):
+        del self.rooms[room.name]
+        if self.drop_game is not None:
+            self.drop_game(room.name)
+
+    def room_of(self, client):
+        room = self.client2room.get(client)
+        if room is None:
+            room = self.join(client)
+        return room
+
+    def join(self, client, name=DEFAULT_ROOM):
+        """ Move the client to the room called name. Returns the room, or None if there are too many rooms. """
+        current = self.client2room.get(client)
+        if current is not None and current.name == name:
+            return current
+        room = self.room(name)
+        if room is None:
+            return None
+        self.leave(client)
+        room.clients.add(client)
+        self.client2room[client] = room
+        return room
+
+    def leave(self, client):
+        room = self.client2room.pop(client, None)
+        if room is not None:
+            room.clients.discard(client)
+            if self._is_idle(room):
+                self._drop(room)
+
+    def remove(self, client):
+        """ Forget a client that disconnected and cancel its orders in every room it played in. """
+        self.leave(client)
+        for room in self.rooms.values():
+            room.game.remove_client(client)
+
+    def handle_messages(self, client, messages):
+        """ Apply join commands here and pass the rest to the game of the client's room, in order.
+
+        Returns the (client, text) messages to send back.
+        """
+        replies = []
+        batch = []
+        for message in messages:
+            if is_join_command(message):
+                replies += self._forward(client, batch)
+                batch = []
+                replies.append(self._join(client, message))
+            else:
+                batch.append(message)
+        replies += self._forward(client, batch)
+        return replies
+
+    def _forward(self, client, messages):
+        if not messages:
+            return []
+        return self.room_of(client).game.handle_messages(client, messages) or []
+
+    def _join(self, client, message):
+        name = parse_room_name(message)
+        if name is None:
+            return client, f"Room names are 1 to {MAX_ROOM_NAME_LENGTH} characters without spaces, for example: {JOIN_COMMAND} final"
+        room = self.join(client, name)
+        if room is None:
+            return client, f"There are too many rooms to open {name}, join one of the existing rooms or try again later"
+        if room.game.is_started():
+            return client, f"You are in room {room.name}. There is an ongoing game, you will get to join the next one."
+        return client, f"You are in room {room.name}. Wait for a game to start."
+
+    def describe(self):
+        """ One line per room for the server console. """
+        return "\n".join(describe_room(room) for room in self.rooms.values())
+
+
+def describe_room(room):
+    s = f"{room.name}: {len(room.clients)} clients, {'game running' if room.game.is_started() else 'no game'}"
+    top = room.game.top_of_book()
+    if top is not None:
+        s += f", bid {top.bid_size} @ {top.bid}, ask {top.ask_size} @ {top.ask}, last {top.last_price}, {top.trades} trades"
+    return s
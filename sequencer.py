@@ -0,0 +1,54 @@
+import logging
+import queue
+import threading
+
+LOG = logging.getLogger(__name__)
+MAX_BATCH = 256
+
+
+class Sequencer:
+    """ Applies every change to the game on a single matching thread, in the order it arrived.
+
+    Client threads, the console and timers only push callbacks onto a queue with call_soon and
+    call_later, so the Game and its OrderBook have exactly one writer and need no locks. The
+    matching thread takes whatever has queued up, up to MAX_BATCH callbacks at a time, and runs
+    them back to back, then calls after_batch if one was given.
+    """
+
+    def __init__(self, after_batch=None):
+        self.queue = queue.SimpleQueue()
+        self.sequence = 0
+        self.thread = None
+        self.after_batch = after_batch
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="matching", daemon=True)
+        self.thread.start()
+
+    def call_soon(self, callback, *args):
+        self.queue.put((callback, args))
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, self.call_soon, (callback,))
+        timer.daemon = True
+        timer.start()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for callback, args in batch:
+                self.sequence += 1
+                try:
+                    callback(*args)
+                except Exception:
+                    LOG.exception(f"Sequenced call {self.sequence} to {callback!r} failed")
+            if self.after_batch is not None:
+                try:
+                    self.after_batch()
+                except Exception:
+                    LOG.exception("After batch callback failed")
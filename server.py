@@ -3,9 +3,20 @@ import argparse
 import _thread
 import logging
 import sys
-from client_communication_tool import ClientCommunicator
+import threading
+import metrics
+from async_server import AsyncServer
+from client_communication_tool import ClientCommunicator, send_parts
+from protocol import FRAMINGS, HEARTBEAT_SECONDS, enable_heartbeats, new_parser
+from rooms import DEFAULT_ROOM, GameRegistry
+from sequencer import Sequencer
+from threaded_client import ThreadedClient
+from workers import WorkerPool
 
-from game import Game
+from game import Game, parse_quote, start_timer  # noqa: F401, parse_quote is still imported from server
+from journal import Journal
+from orderbook import leaderboard_string
+from profiling import SamplingProfiler, default_path
 
 LOG = logging.getLogger(__name__)
 LOG_FILE = "market-making-game-server.log"
@@ -13,10 +24,26 @@ CONSOLE_FORMATTER_PATTERN = "%(message)s"
 HOST = "127.0.0.1"
 PORT = 1234
 DURATION_SECONDS = 10
+PUBLISH_HZ = 20
+ENGINES = ["threads", "asyncio"]
 
+framing = "lines"
+heartbeat_seconds = HEARTBEAT_SECONDS
+game_schedule = start_timer
+publish_hz = 0
+book_depth = None
 connected_clients = set()
 client_communicator = ClientCommunicator()
-game = Game(client_communicator)
+sequencer = Sequencer()
+worker_pool = None
+journal = None
+
+
+def new_game(room_name):
+    return Game(client_communicator, game_schedule, publish_hz, journal, book_depth)
+
+
+registry = GameRegistry(new_game)
 
 
 def error_log(msg):
@@ -31,34 +58,135 @@ def is_help_request(message):
     return message.lower() in ["help", "h"]
 
 
-def client_handler(connection):
-    global game
-
+def greet_client(connection):
+    game = registry.room_of(connection).game
     client_communicator.send_to_clients(connection, f"You are connected to the server. {'Wait for a game to start.' if not game.is_started() else 'There is an ongoing game, you will get to join the next one.'}")
 
+
+def handle_client_messages(connection, messages):
+    if not messages:
+        return
+    metrics.MESSAGES_RECEIVED.inc(len(messages))
+    for receiver, text in registry.handle_messages(connection, messages):
+        client_communicator.send_to_clients(receiver, text)
+
+
+def client_connected(connection):
+    connected_clients.add(connection)
+    registry.join(connection)
+    LOG.info(f"Client connected. Number of clients is now {len(connected_clients)}")
+    greet_client(connection)
+
+
+def client_disconnected(connection):
+    connected_clients.discard(connection)
+    registry.remove(connection)
+    client_communicator.forget(connection)
+    if worker_pool is not None:
+        worker_pool.forget(connection)
+    connection.close()
+    LOG.info(f"Client disconnected. Number of clients is now {len(connected_clients)}")
+
+
+def start_game(duration, orderbook_is_dark, room_name=DEFAULT_ROOM):
+    room = registry.room(room_name)
+    if room is None:
+        info_log(f"There are too many rooms to open {room_name}")
+        return
+    info_log(f"Starting game in room {room.name} with {len(room.clients)} clients")
+    if room.game.start(room.clients, duration, orderbook_is_dark):
+        room.game.client_communicator.send_to_clients(room.clients, "A new game has started")
+    else:
+        info_log(f"There is already a game running in room {room.name}")
+
+
+def stop_game(room_name=DEFAULT_ROOM):
+    room = registry.rooms.get(room_name)
+    if room is None:
+        info_log(f"There is no room {room_name}")
+        return
+    room.game.stop()
+
+
+def list_rooms():
+    info_log(registry.describe() or "There are no rooms")
+
+
+def show_leaderboard(room_name=DEFAULT_ROOM):
+    room = registry.rooms.get(room_name)
+    if room is None:
+        info_log(f"There is no room {room_name}")
+        return
+    info_log(f"Room {room_name}\n" + leaderboard_string(room.game.leaderboard).replace("\n\r", "\n"))
+
+
+def send_queue_depth():
+    return sum(len(getattr(client, "queue", ())) for client in list(connected_clients))
+
+
+def messages_dropped():
+    return sum(getattr(client, "dropped", 0) for client in list(connected_clients))
+
+
+metrics.REGISTRY.gauge("connected_clients", "Clients connected to the server", lambda: len(connected_clients))
+metrics.REGISTRY.gauge("sequencer_queue_depth", "Changes waiting for the matching thread", lambda: sequencer.queue.qsize())
+metrics.REGISTRY.gauge("send_queue_depth", "Messages queued to connected clients", send_queue_depth)
+metrics.REGISTRY.gauge("messages_dropped", "Book snapshots replaced by a newer one before slow connected clients read them", messages_dropped)
+
+
+def client_handler(client):
+    connection = client.connection
+    parser = new_parser(framing)
+    if heartbeat_seconds:
+        enable_heartbeats(connection, heartbeat_seconds)
+
     while True:
         try:
             data = connection.recv(2048)
-        except (ConnectionAbortedError, ConnectionResetError):
-            error_log(f"Client {connection} lost connection to the server")
-            connected_clients.remove(connection)
+        except OSError as e:
+            error_log(f"Client {connection} lost connection to the server: {e}")
+            data = b""
+        if not data:
+            sequencer.call_soon(client_disconnected, client)
             return
-        message = data.decode("utf-8")
 
-        messages_to_send = game.handle_message(connection, message)
-        if messages_to_send is not None:
-            for message_to_send in messages_to_send:
-                receiver, text = message_to_send
-                client_communicator.send_to_clients(receiver, text)
+        commands = parser.feed(data)
+        if commands:
+            sequencer.call_soon(handle_client_messages, client, commands)
 
 
 def accept_client(server_socket):
-    client, _ = server_socket.accept()
+    connection, _ = server_socket.accept()
+    client = ThreadedClient(connection)
 
-    connected_clients.add(client)
+    sequencer.call_soon(client_connected, client)
+    threading.Thread(target=client_handler, args=(client,), name="client", daemon=True).start()
 
-    LOG.info(f"Client connected. Number of clients is now {len(connected_clients)}")
-    _thread.start_new_thread(client_handler, (client,))
+
+profiler = SamplingProfiler(waiting={client_handler.__code__, Sequencer.run.__code__, ThreadedClient.write_loop.__code__, send_parts.__code__})
+
+
+def start_profile():
+    if profiler.start():
+        info_log("Profiling the server's threads, type 'profile stop [file]' to write the samples")
+    else:
+        info_log("The profiler is already running")
+
+
+def stop_profile(path=""):
+    path = path or default_path()
+    if profiler.stop(path):
+        info_log(f"Wrote {profiler.sample_count} samples of the server's threads to {path}")
+    else:
+        info_log("The profiler is not running")
+
+
+def shut_down():
+    """ Write what is left of the journal and stop the worker processes, which close their own. """
+    if worker_pool is not None:
+        worker_pool.stop()
+    if journal is not None:
+        journal.close()
 
 
 def accept_connecting_clients(host, port):
@@ -90,16 +218,70 @@ if __name__ == "__main__":
     parser.add_argument("--port", help="Port", type=int, default=PORT)
     parser.add_argument("--duration", help="Duration of the game (in seconds)", type=int, default=DURATION_SECONDS)
     parser.add_argument("--orderbook-is-dark", help="Hide the orderbook from traders", action="store_true")
+    parser.add_argument("--engine", help="Serve clients with a thread each or from one asyncio event loop", choices=ENGINES, default="threads")
+    parser.add_argument("--publish-hz", help="Most order book updates sent per second, 0 sends one per accepted batch", type=float, default=PUBLISH_HZ)
+    parser.add_argument("--book-depth", help="Price levels of each side sent to clients, 0 sends the whole book", type=int, default=0)
+    parser.add_argument("--framing", help="Commands are newline-terminated (lines) or one per read for older clients (none)", choices=FRAMINGS, default=framing)
+    parser.add_argument("--heartbeat-seconds", help="Probe idle connections this often and drop clients that stop answering, 0 turns it off", type=float, default=heartbeat_seconds)
+    parser.add_argument("--workers", help="Run the games of the rooms in this many worker processes, 0 runs them in the server process", type=int, default=0)
+    parser.add_argument("--worker-per-room", help="Run the game of every room in a worker process of its own", action="store_true")
+    parser.add_argument("--metrics-port", help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics, 0 turns the endpoint off", type=int, default=0)
+    parser.add_argument("--metrics-log-seconds", help="Log a summary of the metrics this often, 0 turns it off", type=float, default=0)
+    parser.add_argument("--journal", help="Append every game's players, accepted orders and fills to this file, replay it with replay.py. Worker processes add their number to the name")
     args = parser.parse_args()
+    framing = args.framing
+    heartbeat_seconds = args.heartbeat_seconds
+    publish_hz = args.publish_hz
+    book_depth = args.book_depth or None
+    if args.workers > 0 or args.worker_per_room:
+        worker_pool = WorkerPool(args.workers, publish_hz, args.worker_per_room, args.journal, book_depth)
+        registry.new_game = worker_pool.new_game
+        registry.drop_game = worker_pool.drop_game
+    elif args.journal:
+        journal = Journal(args.journal)
 
-    info_log("Type 'start' to start a new game when all clients have connected")
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.metrics_log_seconds:
+        metrics.start_log_dump(args.metrics_log_seconds, LOG)
 
-    _thread.start_new_thread(accept_connecting_clients, (args.host, args.port))
-    while True:
-        command = input("")
-        if command == "start":
-            info_log(f"Starting game with {len(connected_clients)} clients")
-            game.start(connected_clients, args.duration, args.orderbook_is_dark)
-            client_communicator.send_to_clients(connected_clients, "A new game has started")
-        elif command == "stop":
-            game.stop()
+    info_log("Type 'start [room]' to start a new game when all clients have connected, 'stop [room]' to stop it, 'leaderboard [room]' to rank the last game, 'rooms' to list the rooms and 'profile start' or 'profile stop [file]' to profile the server")
+
+    if args.engine == "asyncio":
+        async_server = AsyncServer("", args.port, client_connected, handle_client_messages, client_disconnected, framing, heartbeat_seconds)
+        game_schedule = async_server.call_later
+        async_server.start()
+        LOG.info("Listening for connections...")
+        run_on_server = async_server.call_soon
+    else:
+        sequencer.start()
+        game_schedule = sequencer.call_later
+        _thread.start_new_thread(accept_connecting_clients, (args.host, args.port))
+        run_on_server = sequencer.call_soon
+    if worker_pool is not None:
+        # The workers' results are sent to clients from the thread that owns them.
+        worker_pool.call_soon = run_on_server
+        worker_pool.start()
+
+    try:
+        while True:
+            command, _, argument = input("").strip().partition(" ")
+            room_name = argument.strip() or DEFAULT_ROOM
+            if command == "start":
+                run_on_server(start_game, args.duration, args.orderbook_is_dark, room_name)
+            elif command == "stop":
+                run_on_server(stop_game, room_name)
+            elif command == "rooms":
+                run_on_server(list_rooms)
+            elif command == "leaderboard":
+                run_on_server(show_leaderboard, room_name)
+            elif command == "profile":
+                action, _, path = argument.strip().partition(" ")
+                if action == "start":
+                    start_profile()
+                elif action == "stop":
+                    stop_profile(path.strip())
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shut_down()
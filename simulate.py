@@ -0,0 +1,252 @@
+""" Play whole games in-process, without sockets or timers, to compare trading strategies.
+
+A game runs on a VirtualClock: the Game schedules its end and its book updates on it, and time
+only moves when the simulation advances it, so a ten second game takes milliseconds. Every step
+each player's strategy is called with a MarketView and returns the commands to send, the same
+b<price> and s<price> a human would type. The same seed always plays the same games.
+
+Strategies read the book from their MarketView, so by default the text updates the players would
+be sent are not rendered at all; a --publish-hz above 0 renders them at that rate of virtual time.
+
+    python simulate.py --players fair_value:3 mid_follower:2 random:1 --games 2000 --processes 4
+
+Strategies are the functions in STRATEGIES or any "module:function" taking a MarketView.
+"""
+import argparse
+import heapq
+import importlib
+import itertools
+import json
+import random
+import statistics
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from bot import estimate_fair_price
+from client_communication_tool import ClientCommunicator
+from game import Game
+from publisher import Publisher
+
+MarketView = namedtuple("MarketView", "time client_id secret players best_bid best_ask last_price position random")
+
+
+class VirtualClock:
+    """ Runs scheduled callbacks in time order when advanced, instead of on timer threads. """
+
+    def __init__(self):
+        self.now = 0.0
+        self.queue = []
+        self.counter = itertools.count()
+
+    def schedule(self, delay, callback):
+        heapq.heappush(self.queue, (self.now + delay, next(self.counter), callback))
+
+    def advance(self, seconds):
+        """ Move time forward, running every callback that falls due on the way. """
+        end = self.now + seconds
+        while self.queue and self.queue[0][0] <= end:
+            self.now, _, callback = heapq.heappop(self.queue)
+            callback()
+        self.now = end
+
+
+class QuietPublisher(Publisher):
+    """ Renders nothing: simulated players see the market through their MarketView. """
+
+    def mark_dirty(self):
+        pass
+
+    def subscribe(self, client):
+        pass
+
+
+class SimClient:
+    """ An in-memory connection that only counts what the game sends it. """
+
+    def __init__(self, seat, strategy_name, strategy, seed):
+        self.seat = seat
+        self.strategy_name = strategy_name
+        self.strategy = strategy
+        self.random = random.Random(seed)
+        self.bytes_received = 0
+
+    def __repr__(self):
+        return f"SimClient({self.seat}, {self.strategy_name})"
+
+    def __hash__(self):
+        # Seats keep the order of the game's client set, and so the secrets, the same for a seed.
+        return self.seat
+
+    def sendall(self, data):
+        self.bytes_received += len(data)
+
+
+def passive(view):
+    return []
+
+
+def fair_value(view):
+    """ Quote a tight market around the secret plus the average secret of everyone else. """
+    estimate = estimate_fair_price(view.secret, view.players)
+    return [f"b{max(1, round(estimate - 2))}", f"s{round(estimate + 2)}"]
+
+
+def mid_follower(view):
+    """ Join the middle of the book once there is one, starting from the fair value estimate. """
+    if view.best_bid is None or view.best_ask is None:
+        return fair_value(view)
+    mid = (view.best_bid + view.best_ask) / 2
+    return [f"b{max(1, round(mid - 1))}", f"s{round(mid + 1)}"]
+
+
+def random_trader(view):
+    if view.random.random() < 0.5:
+        return []
+    estimate = estimate_fair_price(5, view.players)
+    side = view.random.choice("bs")
+    return [f"{side}{max(1, round(estimate + view.random.randint(-10, 10)))}"]
+
+
+STRATEGIES = {
+    "passive": passive,
+    "fair_value": fair_value,
+    "mid_follower": mid_follower,
+    "random": random_trader,
+}
+
+
+def load_strategy(name):
+    """ A strategy from STRATEGIES, or a function named "module:function". """
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module_name, _, function_name = name.partition(":")
+    if not function_name:
+        raise ValueError(f"Unknown strategy {name}, use one of {', '.join(STRATEGIES)} or module:function")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def market_view(game, clock, client):
+    orderbook = game.orderbook
+    account = orderbook.client2account.get(client)
+    if game.orderbook_is_dark:
+        best_bid = best_ask = last_price = None
+    else:
+        best_bid = orderbook.best_bid()
+        best_ask = orderbook.best_ask()
+        log = orderbook.trade_log
+        last_price = log.price[-1] if len(log) else None
+    return MarketView(
+        clock.now, game.client_to_id[client], game.client_to_secret[client], len(game.clients),
+        best_bid, best_ask, last_price, account.position if account else 0, client.random,
+    )
+
+
+def play_game(lineup, seed, duration=10, step=0.1, publish_hz=0, orderbook_is_dark=False):
+    """ Play one game with a player per strategy name in lineup. Returns (strategy name, secret, P/L) per player. """
+    rnd = random.Random(seed)
+    names = list(lineup)
+    rnd.shuffle(names)
+    clients = [SimClient(seat, name, load_strategy(name), rnd.random()) for seat, name in enumerate(names)]
+
+    clock = VirtualClock()
+    game = Game(ClientCommunicator(), clock.schedule, publish_hz, rng=rnd)
+    if not publish_hz:
+        game.publisher = QuietPublisher(game)
+    game.start(set(clients), duration, orderbook_is_dark)
+    while game.started:
+        rnd.shuffle(clients)
+        for client in clients:
+            commands = client.strategy(market_view(game, clock, client))
+            if commands:
+                game.handle_messages(client, list(commands))
+        clock.advance(step)
+
+    results = []
+    for client in clients:
+        account = game.orderbook.client2account.get(client)
+        pnl = account.settle(game.fair_price) if account else 0
+        results.append((client.strategy_name, game.client_to_secret[client], pnl))
+    return results
+
+
+def play_games(lineup, seeds, duration, step, publish_hz, orderbook_is_dark):
+    """ P/L per strategy name over the games with the given seeds. """
+    strategy2pnl = {}
+    for seed in seeds:
+        for name, _, pnl in play_game(lineup, seed, duration, step, publish_hz, orderbook_is_dark):
+            strategy2pnl.setdefault(name, []).append(pnl)
+    return strategy2pnl
+
+
+def distribution(pnls):
+    pnls = sorted(pnls)
+    cuts = statistics.quantiles(pnls, n=20) if len(pnls) > 1 else pnls * 19
+    return {
+        "count": len(pnls),
+        "mean": statistics.fmean(pnls),
+        "stdev": statistics.stdev(pnls) if len(pnls) > 1 else 0.0,
+        "min": pnls[0],
+        "p5": cuts[0],
+        "p50": cuts[9],
+        "p95": cuts[18],
+        "max": pnls[-1],
+        "win_rate": sum(pnl > 0 for pnl in pnls) / len(pnls),
+    }
+
+
+def simulate(lineup, games, seed=1, processes=1, duration=10, step=0.1, publish_hz=0, orderbook_is_dark=False, batch=100):
+    """ Play games in batches, across a process pool if processes > 1, and return the P/L distribution per strategy. """
+    seeds = range(seed, seed + games)
+    batches = [seeds[i:i + batch] for i in range(0, games, batch)]
+    settings = (duration, step, publish_hz, orderbook_is_dark)
+    strategy2pnl = {}
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(play_games, itertools.repeat(lineup), batches, *[itertools.repeat(s) for s in settings]))
+    else:
+        results = [play_games(lineup, seeds, *settings) for seeds in batches]
+    for result in results:
+        for name, pnls in result.items():
+            strategy2pnl.setdefault(name, []).extend(pnls)
+    return {name: distribution(pnls) for name, pnls in strategy2pnl.items()}
+
+
+def parse_lineup(players):
+    """ ["fair_value:3", "random"] -> ["fair_value", "fair_value", "fair_value", "random"] """
+    lineup = []
+    for player in players:
+        name, _, count = player.rpartition(":")
+        if not name or not count.isnumeric():
+            name, count = player, "1"
+        load_strategy(name)
+        lineup += [name] * int(count)
+    return lineup
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--players", help="Strategies in every game, NAME or NAME:COUNT", nargs="+", default=["fair_value:3", "mid_follower:2", "random:1"])
+    parser.add_argument("--games", help="Number of games to play", type=int, default=1000)
+    parser.add_argument("--seed", help="Seed of the first game", type=int, default=1)
+    parser.add_argument("--processes", help="Worker processes to spread the games over", type=int, default=1)
+    parser.add_argument("--duration", help="Length of each game in virtual seconds", type=float, default=10)
+    parser.add_argument("--step", help="Virtual seconds between the moves of each player", type=float, default=0.1)
+    parser.add_argument("--publish-hz", help="Render the players' text updates this many times per virtual second, 0 skips them", type=float, default=0)
+    parser.add_argument("--orderbook-is-dark", help="Hide the orderbook from the strategies", action="store_true")
+    parser.add_argument("--output", help="Write the distributions to this JSON file")
+    args = parser.parse_args()
+
+    lineup = parse_lineup(args.players)
+    results = simulate(lineup, args.games, args.seed, args.processes, args.duration, args.step, args.publish_hz, args.orderbook_is_dark)
+    for name, result in sorted(results.items(), key=lambda item: -item[1]["mean"]):
+        print(
+            f"{name:<16} n={result['count']:<6} mean {result['mean']:8.2f}  stdev {result['stdev']:7.2f}  "
+            f"p5 {result['p5']:7.1f}  p50 {result['p50']:7.1f}  p95 {result['p95']:7.1f}  win {result['win_rate']:.0%}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import unittest
+from bot import Bot, estimate_fair_price, parse_identity
+
+
+class FakeWriter:
+    def __init__(self):
+        self.sent = []
+
+    def write(self, data):
+        self.sent.append(data)
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.bot = Bot(players=3, seed=1)
+        self.bot.writer = FakeWriter()
+
+    def test_parse_identity(self):
+        self.assertEqual(parse_identity("You are client 12 and your secret is 7\n\rA new game has started"), (12, 7))
+        self.assertIsNone(parse_identity("You are connected to the server."))
+        self.assertEqual(estimate_fair_price(7, 3), 18)
+
+    def test_quotes_after_learning_the_secret(self):
+        self.assertFalse(self.bot.trade())
+        self.bot.handle_line(b'{"type":"text","text":"You are client 2 and your secret is 7\\n\\rA new game has started"}')
+        self.assertEqual((self.bot.client_id, self.bot.secret), (2, 7))
+        self.assertTrue(self.bot.trade())
+        command, price, _ = self.bot.pending
+        self.assertEqual(self.bot.writer.sent, [f"{command}{price}\n".encode("utf-8")])
+        self.assertLessEqual(abs(price - 18), 3)
+        self.assertFalse(self.bot.trade())
+
+        side = "bid" if command == "b" else "ask"
+        self.bot.handle_line(f'{{"type":"delta","seq":1,"levels":[["add","{side}",{price},1]],"trades":[]}}'.encode("utf-8"))
+        self.assertIsNone(self.bot.pending)
+        self.assertEqual(len(self.bot.latencies), 1)
+
+    def test_counts_gaps_and_garbled_messages(self):
+        self.bot.handle_line(b'{"type":"snapshot","seq":4,"bids":[],"asks":[]}')
+        self.bot.handle_line(b'{"type":"delta","seq":6,"levels":[],"trades":[]}')
+        self.bot.handle_line(b'{"type":"del')
+        self.assertEqual((self.bot.gaps, self.bot.garbled), (1, 1))
+        self.assertEqual(self.bot.writer.sent, [b"subscribe\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
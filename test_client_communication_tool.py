@@ -0,0 +1,63 @@
+import json
+import socket
+import unittest
+from client_communication_tool import ClientCommunicator
+from feed import encode
+from test_helpers import FakeClient
+
+
+class ScatterClient(FakeClient):
+    """ Takes only the first few bytes of every sendmsg, like a socket with a full buffer. """
+
+    def sendmsg(self, buffers):
+        data = b"".join(buffers)
+        self.received.append(data[:3])
+        return 3
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.communicator = ClientCommunicator()
+        self.a = FakeClient()
+        self.b = FakeClient()
+        self.feed = FakeClient()
+        self.communicator.subscribe_to_feed(self.feed)
+        self.communicator.add_persistent_information([self.a, self.feed], "You are client 1")
+        self.communicator.add_persistent_information(self.a, "Welcome")
+
+    def test_messages_follow_each_clients_persistent_information(self):
+        sent = self.communicator.send_to_clients([self.a, self.b, self.feed], "A new game has started é")
+        self.assertEqual(self.a.received, ["You are client 1\n\rWelcome\n\rA new game has started é".encode("utf-8")])
+        self.assertEqual(self.b.received, ["A new game has started é".encode("utf-8")])
+        self.assertEqual(self.feed.received, [encode({"type": "text", "text": "You are client 1\n\rA new game has started é"})])
+        self.assertEqual(json.loads(self.feed.received[0])["text"], "You are client 1\n\rA new game has started é")
+        self.assertEqual(sent, sum(len(client.received[0]) for client in (self.a, self.b, self.feed)))
+
+    def test_persistent_information_is_per_client(self):
+        self.communicator.add_persistent_information([self.a, self.b], "Round 2")
+        self.communicator.clear_persistent_information(self.feed)
+        self.communicator.send_to_clients([self.a, self.b, self.feed], "go")
+        self.assertEqual(self.a.received, [b"You are client 1\n\rWelcome\n\rRound 2\n\rgo"])
+        self.assertEqual(self.b.received, [b"Round 2\n\rgo"])
+        self.assertEqual(json.loads(self.feed.received[0])["text"], "go")
+
+    def test_scatter_gather_sends_the_rest_of_a_partial_write(self):
+        client = ScatterClient()
+        self.communicator.add_persistent_information(client, "header")
+        self.communicator.send_encoded(client, (b"book", b"status"))
+        self.assertEqual(client.received, [b"header\n\rbookstatus"])
+        client.received.clear()
+        self.communicator.send_encoded(client, (b"book" * 10000, b"status"))
+        self.assertEqual(client.received[0], b"hea")
+        self.assertEqual(b"".join(client.received), b"header\n\r" + b"book" * 10000 + b"status")
+
+    def test_sockets_get_one_message(self):
+        left, right = socket.socketpair()
+        with left, right:
+            self.communicator.add_persistent_information(left, "header")
+            self.communicator.send_encoded(left, (b"book", b"status"))
+            self.assertEqual(right.recv(100), b"header\n\rbookstatus")
+
+
+if __name__ == '__main__':
+    unittest.main()
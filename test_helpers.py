@@ -0,0 +1,22 @@
+""" Stand-ins shared by the tests. """
+import json
+
+
+class FakeClient:
+    """ A client connection that keeps everything sent to it. """
+
+    def __init__(self, name="client"):
+        self.name = name
+        self.received = []
+
+    def __repr__(self):
+        return self.name
+
+    def sendall(self, data):
+        self.received.append(data)
+
+    def texts(self):
+        return [data.decode("utf-8") for data in self.received]
+
+    def feed_messages(self):
+        return [json.loads(line) for data in self.received for line in data.splitlines()]
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from client_communication_tool import ClientCommunicator
+from game import Game
+from journal import END, FILL, ORDER, QUOTE, RECORD, START, Journal, read_journal
+from replay import replay
+from test_helpers import FakeClient
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "game.journal")
+        self.clients = [FakeClient(name) for name in "abc"]
+
+    def play(self, journal):
+        game = Game(ClientCommunicator(), schedule=lambda delay, callback: None, journal=journal)
+        game.start(set(self.clients), 60, False)
+        a, b, c = self.clients
+        for client, message in [(a, "b20"), (b, "s22"), (c, "s20"), (a, "b23"), (c, "b21"), (b, "s21"), (b, "3@18|24@2"), (a, "2@22|23@4"), (b, "1@18|22@0"), (a, "x")]:
+            game.handle_messages(client, [message])
+        game.remove_client(b)
+        game.end_game()
+        return game
+
+    def test_replay_matches_the_game(self):
+        journal = Journal(self.path)
+        game = self.play(journal)
+        journal.close()
+
+        kinds = [record[0] for record in read_journal(self.path)]
+        self.assertEqual(kinds.count(ORDER), 6)
+        self.assertEqual(kinds.count(QUOTE), 8)
+        self.assertEqual(kinds.count(FILL), len(game.orderbook.trade_log))
+
+        number2game, records = replay(self.path, rebuild_book=True)
+        self.assertEqual(records, len(kinds))
+        replayed = number2game[1]
+        self.assertTrue(replayed.ended)
+        self.assertTrue(replayed.fills_match())
+        self.assertEqual(replayed.orderbook.bids.sizes(), game.orderbook.bids.sizes())
+        self.assertEqual(replayed.orderbook.asks.sizes(), game.orderbook.asks.sizes())
+        for client, client_id in game.client_to_id.items():
+            self.assertEqual(replayed.client2secret[client_id], game.client_to_secret[client])
+            pnl = game.orderbook.client2account[client].settle(game.fair_price) if client in game.orderbook.client2account else 0
+            self.assertEqual(replayed.pnl(client_id), pnl)
+
+    def test_stopped_game_is_ended_once(self):
+        journal = Journal(self.path)
+        game = Game(ClientCommunicator(), schedule=lambda delay, callback: None, journal=journal)
+        game.start(set(self.clients), 60, False)
+        game.stop()
+        game.end_game()
+        journal.close()
+        self.assertEqual([record[0] for record in read_journal(self.path)].count(END), 1)
+        self.assertTrue(replay(self.path)[0][1].ended)
+
+    def test_games_are_numbered_across_restarts(self):
+        for _ in range(2):
+            journal = Journal(self.path)
+            self.play(journal)
+            journal.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\x01\x02\x03")
+        starts = [record[2] for record in read_journal(self.path) if record[0] == START]
+        self.assertEqual(starts, [1, 2])
+        self.assertEqual(sorted(replay(self.path, games={2})[0]), [2])
+        self.assertEqual(os.path.getsize(self.path) % RECORD.size, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import urllib.request
+import metrics
+from client_communication_tool import ClientCommunicator
+from game import Game
+from test_helpers import FakeClient
+
+
+class MyTestCase(unittest.TestCase):
+    def test_histogram_buckets_and_text(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram("test_seconds", "Test", buckets=(0.1, 1))
+        counter = registry.counter("test_total", "Test")
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        counter.inc(3)
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+        text = registry.render()
+        self.assertIn('market_making_game_test_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('market_making_game_test_seconds_bucket{le="1"} 3\n', text)
+        self.assertIn('market_making_game_test_seconds_bucket{le="+Inf"} 4\n', text)
+        self.assertIn("market_making_game_test_seconds_count 4\n", text)
+        self.assertIn("# TYPE market_making_game_test_total counter\nmarket_making_game_test_total 3\n", text)
+
+    def test_game_counts_orders_and_matching(self):
+        accepted = metrics.ORDERS_ACCEPTED.value
+        rejected = metrics.ORDERS_REJECTED.value
+        matches = metrics.MATCH_SECONDS.count
+        client = FakeClient()
+        game = Game(ClientCommunicator(), schedule=lambda delay, callback: None)
+        game.start({client}, 60, False)
+        game.handle_messages(client, ["b20", "hello", "s30", "s10000000000000000000"])
+        self.assertEqual(metrics.ORDERS_ACCEPTED.value - accepted, 2)
+        self.assertEqual(metrics.ORDERS_REJECTED.value - rejected, 2)
+        self.assertEqual(metrics.MATCH_SECONDS.count - matches, 2)
+
+    def test_endpoint_serves_prometheus_text(self):
+        registry = metrics.Registry()
+        registry.gauge("test_depth", "Test", lambda: 7)
+        server = metrics.serve(0, registry=registry)
+        self.addCleanup(server.shutdown)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+            self.assertIn("market_making_game_test_depth 7", response.read().decode("utf-8"))
+
+
+if __name__ == '__main__':
+    unittest.main()
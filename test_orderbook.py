@@ -81,6 +81,167 @@ class MyTestCase(unittest.TestCase):
         ob.update_order(14, order_id3, price=97)
         print(ob)
 
+    def test_best_prices(self):
+        ob = orderbook.OrderBook()
+        self.assertIsNone(ob.best_bid())
+        self.assertIsNone(ob.best_ask())
+        order_id1 = ob.add_order(12, True, 10, 100)
+        order_id2 = ob.add_order(12, True, 5, 101)
+        ob.add_order(14, False, 5, 105)
+        ob.add_order(14, False, 5, 103)
+        self.assertEqual(ob.best_bid(), 101)
+        self.assertEqual(ob.best_ask(), 103)
+        ob.cancel_order(12, order_id2)
+        self.assertEqual(ob.best_bid(), 100)
+        ob.update_order(12, order_id1, price=99)
+        self.assertEqual(ob.best_bid(), 99)
+        ob.add_order(12, True, 7, 104)
+        self.assertEqual(ob.best_ask(), 105)
+        self.assertEqual(list(ob.client2trades[12]), [Trade(True, 5, 103)])
+
+    def test_matching_respects_time_priority(self):
+        ob = orderbook.OrderBook()
+        ob.add_order(1, False, 1, 100)
+        ob.add_order(2, False, 1, 100)
+        ob.add_order(3, False, 1, 100)
+        ob.add_order(14, True, 2, 100)
+        self.assertEqual(list(ob.client2trades[1]), [Trade(False, 1, 100)])
+        self.assertEqual(list(ob.client2trades[2]), [Trade(False, 1, 100)])
+        self.assertNotIn(3, ob.client2trades)
+        self.assertEqual(list(ob.client2trades[14]), [Trade(True, 1, 100), Trade(True, 1, 100)])
+
+    def test_cancel_from_middle_of_queue(self):
+        ob = orderbook.OrderBook()
+        order_id1 = ob.add_order(1, True, 1, 100)
+        order_id2 = ob.add_order(2, True, 2, 100)
+        ob.add_order(3, True, 3, 100)
+        ob.cancel_order(2, order_id2)
+        self.assertEqual(len(ob.bids[100]), 2)
+        self.assertEqual(ob.bids[100].size, 4)
+        ob.update_order(1, order_id1, size=5)
+        self.assertEqual([o.client_id for o in ob.bids[100]], [3, 1])
+
+    def test_shrinking_an_order_keeps_its_place_in_the_queue(self):
+        ob = orderbook.OrderBook()
+        order_id1 = ob.add_order(1, True, 5, 100)
+        ob.add_order(2, True, 1, 100)
+        self.assertEqual(ob.update_order(1, order_id1, size=3, price=100), order_id1)
+        self.assertEqual([o.client_id for o in ob.bids[100]], [1, 2])
+        self.assertEqual(ob.bids[100].size, 4)
+        ob.update_order(1, order_id1, size=2)
+        self.assertEqual([o.client_id for o in ob.bids[100]], [1, 2])
+        self.assertEqual(ob.bids[100].size, 3)
+
+    def test_mass_quote_replaces_both_sides(self):
+        ob = orderbook.OrderBook()
+        ob.mass_quote(1, 5, 100, 105, 5)
+        ob.add_order(2, True, 1, 100)
+        bid_id = ob.client2bid[1]
+        ask_id = ob.client2ask[1]
+        ob.mass_quote(1, 3, 100, 104, 2)
+        self.assertEqual(ob.client2bid[1], bid_id)
+        self.assertEqual([o.client_id for o in ob.bids[100]], [1, 2])
+        self.assertEqual(ob.bids.sizes(), [(100, 4)])
+        self.assertNotEqual(ob.client2ask[1], ask_id)
+        self.assertEqual(ob.asks.sizes(), [(104, 2)])
+        ob.mass_quote(1, 0, 100, 104, 2)
+        self.assertNotIn(1, ob.client2bid)
+        self.assertEqual(ob.bids.sizes(), [(100, 1)])
+
+    def test_mass_quote_never_trades_against_the_quote_it_replaces(self):
+        ob = orderbook.OrderBook()
+        ob.mass_quote(1, 1, 100, 102, 1)
+        ob.mass_quote(1, 1, 103, 104, 1)
+        self.assertEqual(len(ob.trade_log), 0)
+        self.assertEqual(ob.bids.sizes(), [(103, 1)])
+        self.assertEqual(ob.asks.sizes(), [(104, 1)])
+        ob.mass_quote(2, 2, 104, 110, 1)
+        self.assertEqual(list(ob.client2trades[2]), [Trade(True, 1, 104)])
+        self.assertNotIn(1, ob.client2ask)
+        self.assertEqual(ob.bids.sizes(), [(104, 1), (103, 1)])
+
+    def test_orders_are_cached_until_the_book_changes(self):
+        ob = orderbook.OrderBook()
+        for price in range(90, 100):
+            ob.add_order(1, True, 1, price)
+            ob.add_order(2, False, 2, price + 20)
+        book = ob.orders(is_dark=False)
+        self.assertIs(ob.orders(is_dark=False), book)
+        self.assertEqual(book, orderbook.format_levels(ob.bids.sizes(), ob.asks.sizes()))
+        top = ob.orders(is_dark=False, depth=2)
+        self.assertEqual(top, orderbook.format_levels([(99, 1), (98, 1)], [(110, 2), (111, 2)]))
+        self.assertIs(ob.orders(is_dark=False), book)
+
+        version = ob.version()
+        order_id = ob.add_order(3, True, 4, 99)
+        self.assertGreater(ob.version(), version)
+        self.assertIn("    5 @    99", ob.orders(is_dark=False, depth=2))
+        self.assertNotEqual(ob.orders(is_dark=False), book)
+        version = ob.version()
+        ob.update_order(3, order_id, size=2)
+        self.assertGreater(ob.version(), version)
+        self.assertIn("    3 @    99", ob.orders(is_dark=False, depth=2))
+        self.assertEqual(ob.orders(is_dark=False, depth=100), ob.orders(is_dark=False))
+
+    def test_prices_stay_sorted_as_levels_come_and_go(self):
+        ob = orderbook.OrderBook()
+        bids = {price: ob.add_order(1, True, 1, price) for price in (95, 90, 99, 97)}
+        ob.add_order(2, False, 1, 101)
+        ob.add_order(2, False, 1, 100)
+        ob.cancel_order(1, bids[99])
+        ob.update_order(1, bids[90], price=98)
+        self.assertEqual(ob.bids.prices(), [98, 97, 95])
+        self.assertEqual(ob.bids.prices(2), [98, 97])
+        self.assertEqual(ob.bids.prices(0), [])
+        self.assertEqual(ob.asks.prices(1), [100])
+        self.assertEqual(ob.asks.prices(5), [100, 101])
+        self.assertEqual(ob.best_bid(), 98)
+        ob.add_order(3, True, 2, 101)
+        self.assertEqual(ob.asks.prices(), [])
+        self.assertIsNone(ob.best_ask())
+
+    def test_status_shows_the_last_trades(self):
+        ob = orderbook.OrderBook()
+        for price in range(100, 125):
+            ob.add_order(1, False, 1, price)
+            ob.add_order(2, True, 1, price)
+        self.assertEqual(ob.status(2), orderbook.account_string(ob.client2account[2])
+                         + orderbook.trades_string(list(ob.client2trades[2])[-10:], "--- TRADES (last 10 of 25, type 'trades PAGE' for the rest) ---"))
+        self.assertEqual(ob.status(2, last=25), orderbook.account_string(ob.client2account[2]) + orderbook.trades_string(ob.client2trades[2]))
+        self.assertEqual(ob.status(3), orderbook.account_string(orderbook.EMPTY_ACCOUNT) + "--- TRADES ---\n\r")
+        self.assertEqual(ob.trades_page(1, 3, page_size=10), orderbook.trades_string(list(ob.client2trades[1])[20:], "--- TRADES page 3 of 3 ---"))
+        self.assertEqual(ob.trades_page(1, 0, page_size=10), orderbook.trades_string(list(ob.client2trades[1])[:10], "--- TRADES page 1 of 3 ---"))
+        self.assertEqual(ob.trades_page(3, 1), "--- TRADES ---\n\r")
+
+    def test_out_of_range_orders_leave_the_book_alone(self):
+        ob = orderbook.OrderBook()
+        order_id = ob.add_order(1, False, 1, 100)
+        with self.assertRaises(ValueError):
+            ob.add_order(2, True, 1, 10 ** 19)
+        with self.assertRaises(ValueError):
+            ob.update_order(1, order_id, size=orderbook.MAX_SIZE + 1)
+        with self.assertRaises(ValueError):
+            ob.trade_log.append(True, 1, 10 ** 19, 1, 2)
+        self.assertEqual(ob.asks.sizes(), [(100, 1)])
+        self.assertEqual(len(ob.trade_log), 0)
+        self.assertEqual({len(column) for column in (ob.trade_log.side, ob.trade_log.size, ob.trade_log.price)}, {0})
+
+    def test_filled_and_cancelled_orders_are_released(self):
+        ob = orderbook.OrderBook()
+        order_id1 = ob.add_order(12, True, 10, 100)
+        order_id2 = ob.add_order(12, True, 10, 99)
+        ob.client2bid[12] = order_id1
+        ob.add_order(14, False, 10, 100)
+        ob.cancel_order(12, order_id2)
+        self.assertEqual(ob.id2order, {})
+        self.assertNotIn(12, ob.client2bid)
+        self.assertIsNone(ob.update_order(12, order_id1, price=101))
+        self.assertIsNone(ob.cancel_order(12, order_id2))
+
+    def test_order_ids_are_per_book(self):
+        self.assertEqual(orderbook.OrderBook().add_order(12, True, 10, 100),
+                         orderbook.OrderBook().add_order(12, True, 10, 100))
+
     def test_position(self):
         trades = [Trade(True, 10, 100), Trade(False, 5, 110)]
         pos = orderbook.position(trades)
@@ -102,6 +263,26 @@ class MyTestCase(unittest.TestCase):
         rpl = orderbook.realized_pnl(trades)
         self.assertEqual(rpl, -80)
 
+    def test_account_matches_trade_list(self):
+        trades = [Trade(True, 5, 100), Trade(True, 5, 110), Trade(False, 7, 105), Trade(False, 6, 120), Trade(True, 2, 90)]
+        account = orderbook.Account()
+        for t in trades:
+            account.add_fill(t.is_buy, t.size, t.price)
+            self.assertEqual(account.realized_pnl, orderbook.realized_pnl(trades[:trades.index(t) + 1]))
+        self.assertEqual(account.position, orderbook.position(trades))
+        self.assertEqual(account.settle(100), -5 * 100 - 5 * 110 + 7 * 105 + 6 * 120 - 2 * 90 + -1 * 100)
+
+    def test_leaderboard_ranks_settled_pnl(self):
+        ob = orderbook.OrderBook()
+        ob.add_order("a", True, 2, 10)
+        ob.add_order("b", False, 1, 10)
+        ob.add_order("c", False, 1, 10)
+        client2id = {"a": 1, "b": 2, "c": 3, "d": 4}
+        result = ob.result(12, client2id)
+        self.assertEqual(result, "--- RESULT ---\n\rP/L for client 1: 4\n\rP/L for client 2: -2\n\rP/L for client 3: -2\n\rP/L for client 4: 0\n\r\n\rFair price for the instrument was 12\n\r")
+        self.assertEqual(ob.leaderboard(12, client2id), [(1, 1, 4), (2, 4, 0), (3, 2, -2), (3, 3, -2)])
+        self.assertEqual(len(ob.client2trades["a"]), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
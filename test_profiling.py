@@ -0,0 +1,84 @@
+import marshal
+import os
+import pstats
+import queue
+import tempfile
+import threading
+import unittest
+from profiling import SamplingProfiler, blocking_lines
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+def consume(items, stop):
+    while not stop.is_set():
+        for _ in range(1000000):
+            pass
+        try:
+            items.get(timeout=0.001)
+        except queue.Empty:
+            pass
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.stop = threading.Event()
+        self.waiter = threading.Thread(target=self.stop.wait, name="waiter")
+        self.spinner = threading.Thread(target=spin, args=(self.stop,), name="spinner")
+        self.waiter.start()
+        self.spinner.start()
+        self.addCleanup(self.spinner.join)
+        self.addCleanup(self.waiter.join)
+        self.addCleanup(self.stop.set)
+        self.profiler = SamplingProfiler(interval=0.001)
+        self.assertTrue(self.profiler.start())
+        self.assertFalse(self.profiler.start())
+        while self.profiler.sample_count < 20:
+            self.stop.wait(0.01)
+
+    def test_collapsed_stacks_leave_out_waiting_threads(self):
+        path = os.path.join(self.directory.name, "profile.folded")
+        self.assertTrue(self.profiler.stop(path))
+        self.assertFalse(self.profiler.stop(path))
+        with open(path) as file:
+            lines = file.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any(line.startswith("spinner;") and "test_profiling.py:spin" in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            # Threads left running by other test modules are sampled too, only look at this test's own.
+            self.assertFalse(stack.startswith("waiter;"), stack)
+
+    def test_waiting_functions_keep_their_own_time(self):
+        self.assertEqual(blocking_lines(consume.__code__), {consume.__code__.co_firstlineno + 5})
+        self.profiler.stop()
+        consumer = threading.Thread(target=consume, args=(queue.SimpleQueue(), self.stop), name="consumer")
+        consumer.start()
+        profiler = SamplingProfiler(interval=0.001, waiting={consume.__code__})
+        profiler.start()
+        while profiler.sample_count < 50:
+            self.stop.wait(0.01)
+        profiler.stop()
+        self.stop.set()
+        consumer.join()
+        self.assertTrue(any(thread_name == "consumer" for thread_name, _ in profiler.samples))
+
+    def test_pstats_file_loads(self):
+        path = os.path.join(self.directory.name, "profile.pstats")
+        self.profiler.stop(path)
+        with open(path, "rb") as file:
+            self.assertTrue(marshal.load(file))
+        stats = pstats.Stats(path)
+        spin_stats = [value for key, value in stats.stats.items() if key[2] == "spin"]
+        self.assertEqual(len(spin_stats), 1)
+        self.assertGreater(spin_stats[0][3], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
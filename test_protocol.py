@@ -0,0 +1,36 @@
+import socket
+import unittest
+import protocol
+
+
+class MyTestCase(unittest.TestCase):
+    def test_heartbeats_turn_on_keepalive_probes(self):
+        with socket.socket() as connection:
+            protocol.enable_heartbeats(connection, seconds=5, probes=2)
+            self.assertTrue(connection.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                self.assertEqual(connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE), 5)
+
+    def test_several_commands_in_one_read(self):
+        parser = protocol.new_parser("lines")
+        self.assertEqual(parser.feed(b"b20\ns30\r\nb21\n"), ["b20", "s30", "b21"])
+
+    def test_command_split_across_reads(self):
+        parser = protocol.new_parser("lines")
+        self.assertEqual(parser.feed(b"b2"), [])
+        self.assertEqual(parser.feed(b"0\ns3"), ["b20"])
+        self.assertEqual(parser.feed(b"0\n"), ["s30"])
+
+    def test_overlong_garbage_is_dropped(self):
+        parser = protocol.new_parser("lines")
+        self.assertEqual(parser.feed(b"x" * (protocol.MAX_COMMAND_LENGTH + 1)), [])
+        self.assertEqual(parser.feed(b"\nb20\n"), ["b20"])
+
+    def test_unframed_read_is_one_command(self):
+        parser = protocol.new_parser("none")
+        self.assertEqual(parser.feed(b"b20"), ["b20"])
+        self.assertEqual(parser.feed(b""), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from client_communication_tool import ClientCommunicator
+from feed import LocalBook
+from game import Game
+from test_helpers import FakeClient
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.a = FakeClient("a")
+        self.b = FakeClient("b")
+        self.communicator = ClientCommunicator()
+        self.scheduled = []
+        self.game = Game(self.communicator, schedule=lambda delay, callback: self.scheduled.append(callback), publish_hz=20)
+        self.game.start({self.a, self.b}, 60, orderbook_is_dark=False)
+        # The game schedules its first update, then its end.
+        first_flush, _ = self.scheduled
+        self.scheduled.clear()
+        first_flush()
+
+    def flush(self):
+        self.a.received.clear()
+        self.b.received.clear()
+        self.scheduled.pop()()
+
+    def test_book_is_sent_when_the_game_starts(self):
+        for client in (self.a, self.b):
+            self.assertEqual(len(client.received), 1)
+            self.assertIn(b"--- ORDER BOOK ---", client.received[0])
+            self.assertIn(b"pos = 0", client.received[0])
+
+    def test_changes_are_coalesced_into_one_flush(self):
+        self.a.received.clear()
+        self.b.received.clear()
+        self.game.handle_messages(self.a, ["b20"])
+        self.game.handle_messages(self.a, ["s30"])
+        self.assertEqual(len(self.scheduled), 1)
+        self.assertEqual(self.a.received, [])
+        self.assertEqual(self.b.received, [])
+        self.flush()
+        self.assertEqual(len(self.a.received), 1)
+        self.assertEqual(len(self.b.received), 1)
+        self.assertIn(b"1 @    20 | 30    @ 1", self.b.received[0])
+
+    def test_unchanged_views_are_skipped(self):
+        self.game.orderbook_is_dark = True
+        self.game.handle_messages(self.a, ["b20"])
+        self.flush()
+        self.game.handle_messages(self.a, ["b19"])
+        self.flush()
+        self.assertEqual(self.a.received, [])
+        self.assertEqual(self.b.received, [])
+        self.game.handle_messages(self.b, ["s19"])
+        self.flush()
+        self.assertEqual(len(self.a.received), 1)
+        self.assertEqual(len(self.b.received), 1)
+
+    def test_status_stays_bounded_and_trades_are_paged(self):
+        for _ in range(30):
+            self.game.handle_messages(self.a, ["b20"])
+            self.game.handle_messages(self.b, ["s20"])
+        self.flush()
+        status = self.b.received[0].decode("utf-8").split("--- ACCOUNT ---")[1]
+        self.assertIn("pos = -30", status)
+        self.assertIn("last 10 of 30", status)
+        self.assertEqual(status.count("Sell 1 @ 20"), 10)
+        replies = self.game.handle_messages(self.b, ["trades", "trades 9", "trades x"])
+        self.assertEqual([client for client, _ in replies], [self.b] * 3)
+        self.assertIn("page 1 of 1", replies[0][1])
+        self.assertEqual(replies[0][1].count("Sell 1 @ 20"), 30)
+        self.assertEqual(replies[1][1], replies[0][1])
+        self.assertIn("Type 'trades'", replies[2][1])
+        self.assertEqual(self.scheduled, [])
+
+    def test_feed_keeps_local_book_in_sync(self):
+        self.game.handle_messages(self.a, ["b20", "s30"])
+        self.game.handle_messages(self.b, ["subscribe"])
+        self.flush()
+        self.assertEqual([m["type"] for m in self.b.feed_messages()], ["snapshot"])
+        local_book = LocalBook()
+        local_book.apply(self.b.feed_messages()[0])
+
+        self.game.handle_messages(self.b, ["b21", "s30"])
+        self.flush()
+        for message in self.b.feed_messages():
+            local_book.apply(message)
+        self.game.handle_messages(self.a, ["s21"])
+        self.flush()
+        messages = self.b.feed_messages()
+        self.assertEqual([m["type"] for m in messages], ["delta", "status"])
+        self.assertEqual(messages[0]["trades"], [[21, 1, "sell"]])
+        for message in messages:
+            local_book.apply(message)
+        self.assertTrue(local_book.in_sync())
+        self.assertEqual(local_book.bids, {20: 1})
+        self.assertEqual(local_book.asks, {30: 1})
+        self.assertEqual(local_book.render(), self.communicator.persistent_information[self.b] + "\n\r"
+                         + self.game.orderbook.orders(is_dark=False) + self.game.orderbook.status(self.b))
+
+
+if __name__ == '__main__':
+    unittest.main()
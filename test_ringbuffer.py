@@ -0,0 +1,64 @@
+import unittest
+from marketdata import MarketDataReader, MarketDataWriter
+from orderbook import OrderBook
+import ringbuffer
+from ringbuffer import RingBuffer
+
+
+class FakeGame:
+    def __init__(self, orderbook):
+        self.orderbook = orderbook
+        self.client_to_id = {"a": 1, "b": 2}
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.ring = RingBuffer("<qq", 4)
+        self.addCleanup(self.ring.close)
+
+    def test_readers_attach_by_name(self):
+        reader = RingBuffer("<qq", 4, self.ring.name)
+        self.addCleanup(reader.close)
+        self.ring.append(1, 10)
+        self.ring.append(2, 20)
+        self.assertEqual(reader.read(0), ([(1, 10), (2, 20)], 2, 0))
+        self.assertEqual(reader.read(2), ([], 2, 0))
+
+    def test_slow_readers_lose_the_oldest_records(self):
+        for n in range(6):
+            self.ring.append(n, n)
+        records, position, lost = self.ring.read(0)
+        self.assertEqual(records, [(2, 2), (3, 3), (4, 4), (5, 5)])
+        self.assertEqual((position, lost), (6, 2))
+
+    def test_records_being_overwritten_are_lost_not_torn(self):
+        for n in range(3):
+            self.ring.append(n, n)
+        # The writer has started on the slot of record 1 but not finished it.
+        ringbuffer.STAMP.pack_into(self.ring.buffer, self.ring._offset(1), 0)
+        self.assertEqual(self.ring.read(0), ([(0, 0), (2, 2)], 3, 1))
+
+    def test_market_data_round_trip(self):
+        reader = MarketDataReader()
+        self.addCleanup(reader.close)
+        writer = MarketDataWriter(*reader.names())
+        self.addCleanup(writer.close)
+        game = FakeGame(OrderBook())
+        game.orderbook.add_order("a", True, 2, 20)
+        game.orderbook.add_order("b", False, 1, 20)
+        game.orderbook.add_order("b", False, 3, 25)
+        writer.publish(7, 1, game)
+        writer.publish(7, 1, game)
+        reader.poll()
+        self.assertEqual(reader.top_of_book(7), (20, 1, 25, 3, 20, 1))
+        self.assertEqual(reader.tops.read(0)[1], 1)
+        self.assertEqual(reader.fills.read(0)[0][0][:7], (7, 1, 20, 1, 0, 1, 2))
+
+        game.orderbook = OrderBook()
+        writer.publish(7, 2, game)
+        reader.poll()
+        self.assertEqual(reader.top_of_book(7), (None, 0, None, 0, None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
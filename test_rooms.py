@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import unittest
+from client_communication_tool import ClientCommunicator
+from game import Game
+from rooms import GameRegistry
+from sequencer import Sequencer
+from test_helpers import FakeClient
+from workers import WorkerPool
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.communicator = ClientCommunicator()
+        self.registry = GameRegistry(lambda name: Game(self.communicator, schedule=lambda delay, callback: None))
+        self.a = FakeClient("a")
+        self.b = FakeClient("b")
+        self.c = FakeClient("c")
+        for client in (self.a, self.b, self.c):
+            self.registry.join(client)
+
+    def start(self, room_name):
+        room = self.registry.room(room_name)
+        room.game.start(room.clients, 60, False)
+        return room.game
+
+    def test_clients_join_rooms_by_command(self):
+        replies = self.registry.handle_messages(self.b, ["join final"])
+        self.assertEqual(replies, [(self.b, "You are in room final. Wait for a game to start.")])
+        self.assertEqual(self.registry.room("main").clients, {self.a, self.c})
+        self.assertEqual(self.registry.room("final").clients, {self.b})
+        self.assertEqual(self.registry.handle_messages(self.b, ["join"])[0][0], self.b)
+        self.assertEqual(self.registry.room_of(self.b).name, "final")
+
+    def test_each_room_has_its_own_game_and_book(self):
+        self.registry.handle_messages(self.c, ["join final"])
+        main = self.start("main")
+        final = self.start("final")
+        self.registry.handle_messages(self.a, ["b20"])
+        self.registry.handle_messages(self.b, ["s20"])
+        self.registry.handle_messages(self.c, ["s25"])
+        self.assertEqual(len(main.orderbook.trade_log), 1)
+        self.assertEqual(final.orderbook.best_ask(), 25)
+        self.assertEqual(final.clients, {self.c})
+        self.assertIn(self.c, self.communicator.persistent_information)
+        self.assertIn(self.a, self.communicator.persistent_information)
+
+    def test_commands_after_join_go_to_the_new_room(self):
+        self.start("main")
+        replies = self.registry.handle_messages(self.a, ["b20", "join final", "b21"])
+        self.assertEqual(self.registry.room("main").game.orderbook.best_bid(), 20)
+        self.assertEqual(replies[-1], (self.a, "You are not part of a started game. Wait until one starts."))
+
+    def test_empty_rooms_are_dropped_and_their_number_capped(self):
+        dropped = []
+        registry = GameRegistry(lambda name: Game(self.communicator, schedule=lambda delay, callback: None), dropped.append, max_rooms=2)
+        registry.join(self.a)
+        registry.handle_messages(self.a, ["join one"])
+        registry.handle_messages(self.b, ["join two"])
+        replies = registry.handle_messages(self.c, ["join three"])
+        self.assertIn("too many rooms", replies[0][1])
+        self.assertEqual(registry.room_of(self.c).name, "main")
+        self.assertIsNone(registry.room("three"))
+
+        game = registry.room("two").game
+        game.start({self.b}, 60, False)
+        registry.handle_messages(self.b, ["join main"])
+        self.assertIn("two", registry.rooms)
+        game.end_game()
+        registry.handle_messages(self.a, ["join main"])
+        self.assertEqual(dropped, ["one"])
+        self.assertNotIn("one", registry.rooms)
+        self.assertEqual(registry.handle_messages(self.c, ["join three"]), [(self.c, "You are in room three. Wait for a game to start.")])
+        self.assertEqual(set(registry.rooms), {"main", "two", "three"})
+        registry.handle_messages(self.a, ["join four"])
+        self.assertEqual(dropped, ["one", "two"])
+        self.assertEqual(set(registry.rooms), {"main", "three", "four"})
+
+    def test_worker_of_a_dropped_room_is_stopped(self):
+        pool = WorkerPool(0, per_room=True)
+        pool.start()
+        self.addCleanup(pool.stop)
+        registry = GameRegistry(pool.new_game, pool.drop_game)
+        registry.join(self.a, "final")
+        worker = registry.room("final").game.worker
+        name = worker.market_data.names()[0]
+        registry.join(self.a)
+        self.assertNotIn("final", registry.rooms)
+        self.assertNotIn(worker, pool.workers)
+        worker.process.join(30)
+        self.assertFalse(worker.process.is_alive())
+        if not os.path.isdir("/dev/shm"):
+            return
+        deadline = time.time() + 30
+        while os.path.exists(f"/dev/shm/{name}") and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(os.path.exists(f"/dev/shm/{name}"))
+
+    def test_worker_pool_runs_games_in_other_processes(self):
+        pool = WorkerPool(2)
+        pool.start()
+        try:
+            registry = GameRegistry(pool.new_game)
+            a = FakeClient("a")
+            b = FakeClient("b")
+            registry.join(a)
+            registry.join(b, "final")
+            self.assertNotEqual(registry.room("main").game.worker, registry.room("final").game.worker)
+            room = registry.room("final")
+            room.game.start(room.clients, 0.2, False)
+            registry.handle_messages(b, ["b20"])
+            registry.handle_messages(a, ["b20"])
+            deadline = time.time() + 30
+            while room.game.is_started() or not any("P/L" in text for text in b.texts()):
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.05)
+            self.assertTrue(any("You are client 1" in text and "20" in text for text in b.texts()))
+            self.assertEqual(a.texts(), ["You are not part of a started game. Wait until one starts."])
+            deadline = time.time() + 5
+            while room.game.top_of_book() is None:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.05)
+            self.assertEqual(room.game.top_of_book(), (20, 1, None, 0, None, 0))
+        finally:
+            pool.stop()
+
+    def test_worker_results_are_sent_from_the_server_thread(self):
+        sequencer = Sequencer()
+        sequencer.start()
+        pool = WorkerPool(1, call_soon=sequencer.call_soon)
+        pool.start()
+        self.addCleanup(pool.stop)
+        threads = []
+        a = FakeClient("a")
+        a.sendall = lambda data: threads.append(threading.current_thread().name)
+        registry = GameRegistry(pool.new_game)
+        registry.handle_messages(a, ["b20"])
+        deadline = time.time() + 30
+        while not threads:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.05)
+        self.assertEqual(threads, ["matching"])
+
+    def test_worker_per_room(self):
+        pool = WorkerPool(0, per_room=True)
+        pool.start()
+        try:
+            registry = GameRegistry(pool.new_game)
+            a = FakeClient("a")
+            b = FakeClient("b")
+            registry.join(a, "one")
+            registry.join(b, "two")
+            self.assertEqual(len(pool.workers), 2)
+            for room_name in ("one", "two"):
+                room = registry.room(room_name)
+                room.game.start(room.clients, 60, False)
+            registry.handle_messages(a, ["s30"])
+            registry.handle_messages(b, ["b10"])
+            deadline = time.time() + 30
+            while registry.room("one").game.top_of_book() is None or registry.room("two").game.top_of_book() is None:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.05)
+            self.assertEqual(registry.room("one").game.top_of_book().ask, 30)
+            self.assertEqual(registry.room("two").game.top_of_book().bid, 10)
+
+            registry.remove(a)
+            pool.forget(a)
+            deadline = time.time() + 30
+            while registry.room("one").game.top_of_book().ask is not None:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.05)
+            self.assertEqual(registry.room("two").game.top_of_book().bid, 10)
+        finally:
+            pool.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
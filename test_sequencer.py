@@ -0,0 +1,43 @@
+import threading
+import unittest
+from sequencer import Sequencer
+
+
+class MyTestCase(unittest.TestCase):
+    def test_callbacks_run_in_order_on_one_thread(self):
+        sequencer = Sequencer()
+        sequencer.start()
+        calls = []
+        done = threading.Event()
+
+        def record(producer, i):
+            calls.append((producer, i, threading.current_thread().name))
+
+        def submit(producer):
+            for i in range(100):
+                sequencer.call_soon(record, producer, i)
+
+        producers = [threading.Thread(target=submit, args=(producer,)) for producer in range(4)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        sequencer.call_soon(done.set)
+        self.assertTrue(done.wait(5))
+
+        self.assertEqual(len(calls), 400)
+        self.assertEqual({thread for _, _, thread in calls}, {"matching"})
+        for producer in range(4):
+            self.assertEqual([i for p, i, _ in calls if p == producer], list(range(100)))
+
+    def test_failing_callback_does_not_stop_the_sequencer(self):
+        sequencer = Sequencer()
+        sequencer.start()
+        done = threading.Event()
+        sequencer.call_soon(lambda: 1 / 0)
+        sequencer.call_soon(done.set)
+        self.assertTrue(done.wait(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
+import socket
 import unittest
 import server
+from async_server import AsyncServer
+from threaded_client import ThreadedClient
 
 
 class MyTestCase(unittest.TestCase):
@@ -10,6 +13,43 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(ask, 30)
         self.assertEqual(ask_volume, 40)
 
+    def test_parse_incorrect_quote(self):
+        for message in ["10@20", "10@20|30", "b20|s30", "10@-20|30@40", "", "1@1|10000000000000000000@1"]:
+            self.assertIsNone(server.parse_quote(message))
+
+    def test_asyncio_engine_greets_clients(self):
+        async_server = AsyncServer("127.0.0.1", 0, server.client_connected, server.handle_client_messages, server.client_disconnected)
+        async_server.start()
+        with socket.create_connection(("127.0.0.1", async_server.port), timeout=5) as connection:
+            self.assertIn("You are connected to the server", connection.recv(2048).decode("utf-8"))
+            connection.sendall(b"b20\n")
+            self.assertIn("You are not part of a started game", connection.recv(2048).decode("utf-8"))
+
+    def test_disconnected_client_is_removed_and_its_orders_cancelled(self):
+        connection, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        connection = ThreadedClient(connection)
+        room = server.registry.room("disconnect")
+        room.game.schedule = lambda delay, callback: None
+        server.client_connected(connection)
+        server.registry.join(connection, room.name)
+        server.start_game(60, False, room.name)
+        server.handle_client_messages(connection, ["b20", "s30"])
+        self.assertEqual(room.game.orderbook.bids.sizes(), [(20, 1)])
+
+        peer.close()
+        server.client_handler(connection)
+        callback, args = server.sequencer.queue.get(timeout=5)
+        callback(*args)
+
+        self.assertNotIn(connection, server.connected_clients)
+        self.assertNotIn(connection, room.clients)
+        self.assertNotIn(connection, room.game.clients)
+        self.assertEqual(room.game.orderbook.bids.sizes(), [])
+        self.assertEqual(room.game.orderbook.asks.sizes(), [])
+        self.assertNotIn(connection, server.client_communicator.persistent_information)
+        self.assertEqual(connection.connection.fileno(), -1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,40 @@
+import random
+import unittest
+from simulate import VirtualClock, parse_lineup, play_game, simulate
+
+
+class MyTestCase(unittest.TestCase):
+    def test_virtual_clock_runs_callbacks_in_time_order(self):
+        clock = VirtualClock()
+        calls = []
+        clock.schedule(2, lambda: calls.append(("b", clock.now)))
+        clock.schedule(1, lambda: clock.schedule(0.5, lambda: calls.append(("c", clock.now))))
+        clock.schedule(1, lambda: calls.append(("a", clock.now)))
+        clock.advance(1.75)
+        self.assertEqual(calls, [("a", 1), ("c", 1.5)])
+        clock.advance(1)
+        self.assertEqual(calls[-1], ("b", 2))
+        self.assertEqual(clock.now, 2.75)
+
+    def test_games_are_deterministic_and_zero_sum(self):
+        lineup = parse_lineup(["fair_value:2", "mid_follower", "simulate:random_trader"])
+        self.assertEqual(lineup, ["fair_value", "fair_value", "mid_follower", "simulate:random_trader"])
+        results = play_game(lineup, seed=7, duration=2)
+        self.assertEqual(results, play_game(lineup, seed=7, duration=2))
+        self.assertEqual(sorted(name for name, _, _ in results), sorted(lineup))
+        self.assertEqual(sum(pnl for _, _, pnl in results), 0)
+
+    def test_games_leave_the_random_module_alone(self):
+        state = random.getstate()
+        play_game(["fair_value", "random"], seed=7, duration=1)
+        self.assertEqual(random.getstate(), state)
+
+    def test_distributions_per_strategy(self):
+        results = simulate(["fair_value", "passive", "random"], games=20, duration=1, batch=7)
+        self.assertEqual(results["passive"]["count"], 20)
+        self.assertEqual(results["passive"]["mean"], 0)
+        self.assertLessEqual(results["random"]["p5"], results["random"]["p95"])
+
+
+if __name__ == '__main__':
+    unittest.main()
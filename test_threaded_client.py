@@ -0,0 +1,79 @@
+import socket
+import time
+import unittest
+from async_server import SendQueue
+from threaded_client import ThreadedClient
+
+
+class MyTestCase(unittest.TestCase):
+    def test_messages_are_written_in_order(self):
+        connection, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        client = ThreadedClient(connection)
+        self.addCleanup(client.close)
+        client.sendall(b"a")
+        client.sendmsg([b"b", b"c"])
+        peer.settimeout(5)
+        received = b""
+        while len(received) < 3:
+            received += peer.recv(16)
+        self.assertEqual(received, b"abc")
+
+    def test_slow_reader_gets_the_latest_snapshot(self):
+        connection, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        client = ThreadedClient(connection, max_queued=2)
+        self.addCleanup(client.close)
+        message = b"x" * 65536
+        started = time.monotonic()
+        for _ in range(100):
+            client.send_snapshot((b"book", message))
+        client.sendall(b"result")
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertFalse(client.closed)
+        self.assertLessEqual(len(client.queue), 2)
+        self.assertGreater(client.dropped, 0)
+        self.assertEqual(client.queue.messages[-1], b"result")
+
+    def test_slow_reader_is_disconnected_rather_than_losing_messages(self):
+        connection, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        client = ThreadedClient(connection, max_queued=2)
+        self.addCleanup(client.close)
+        started = time.monotonic()
+        for _ in range(100):
+            client.sendall(b"x" * 65536)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(client.closed)
+        self.assertEqual(client.dropped, 0)
+        peer.settimeout(5)
+        while peer.recv(65536):
+            pass
+
+    def test_send_queue_replaces_only_snapshots(self):
+        queue = SendQueue(max_queued=3)
+        self.assertTrue(queue.put(b"delta 1"))
+        self.assertTrue(queue.put(b"old book", is_snapshot=True))
+        self.assertTrue(queue.put(b"delta 2"))
+        self.assertTrue(queue.put(b"new book", is_snapshot=True))
+        self.assertEqual(queue.replaced, 1)
+        self.assertEqual([queue.pop() for _ in range(len(queue))], [b"delta 1", b"delta 2", b"new book"])
+        for _ in range(3):
+            self.assertTrue(queue.put(b"delta"))
+        self.assertFalse(queue.put(b"delta"))
+
+    def test_close_stops_the_writer(self):
+        connection, peer = socket.socketpair()
+        self.addCleanup(peer.close)
+        client = ThreadedClient(connection)
+        for _ in range(100):
+            client.sendall(b"x" * 65536)
+        client.close()
+        client.thread.join(5)
+        self.assertFalse(client.thread.is_alive())
+        client.sendall(b"after close")
+        self.assertEqual(len(client.queue), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+""" Client connections of the threads engine. """
+import logging
+import socket
+import threading
+
+from async_server import MAX_QUEUED_MESSAGES, SendQueue
+from client_communication_tool import send_parts
+
+LOG = logging.getLogger(__name__)
+
+
+class ThreadedClient:
+    """ A client socket whose messages are written by a thread of its own.
+
+    The game talks to clients through ClientCommunicator, which calls sendall, sendmsg or
+    send_snapshot on the matching thread. Here they only queue the bytes in a SendQueue, so a
+    client that stops reading blocks its own writer thread, not the matching thread or the other
+    clients, and is disconnected as on the asyncio engine if it falls too far behind. The client's
+    handler thread reads from connection.
+    """
+
+    def __init__(self, connection, max_queued=MAX_QUEUED_MESSAGES):
+        self.connection = connection
+        self.queue = SendQueue(max_queued)
+        self.closed = False
+        self._has_data = threading.Condition()
+        self.thread = threading.Thread(target=self.write_loop, name="client-writer", daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return f"ThreadedClient({self.connection.fileno()})"
+
+    @property
+    def dropped(self):
+        """ Book snapshots replaced by a newer one before they were written. """
+        return self.queue.replaced
+
+    def sendall(self, data):
+        self._enqueue(data, False)
+
+    def send_snapshot(self, data):
+        """ Queue a book snapshot, bytes or a tuple of buffers, in place of one still waiting. """
+        self._enqueue(data, True)
+
+    def _enqueue(self, data, is_snapshot):
+        with self._has_data:
+            if self.closed:
+                return
+            keeping_up = self.queue.put(data, is_snapshot)
+            self._has_data.notify()
+        if not keeping_up:
+            LOG.warning(f"Disconnecting {self}, it has more than {self.queue.max_queued} messages waiting")
+            # The handler thread's recv then returns nothing and reports the disconnect.
+            self.shutdown()
+
+    def sendmsg(self, buffers):
+        """ Queue the buffers as one message, written with sendmsg. """
+        buffers = tuple(buffers)
+        self.sendall(buffers)
+        return sum(len(buffer) for buffer in buffers)
+
+    def write_loop(self):
+        while True:
+            with self._has_data:
+                while not self.queue and not self.closed:
+                    self._has_data.wait()
+                if self.closed:
+                    return
+                data = self.queue.pop()
+            try:
+                if isinstance(data, tuple):
+                    send_parts(self.connection, data)
+                else:
+                    self.connection.sendall(data)
+            except OSError:
+                # The handler thread's recv fails as well and reports the disconnect.
+                self.shutdown()
+                return
+
+    def shutdown(self):
+        """ Stop writing and wake up anything blocked on the socket. """
+        with self._has_data:
+            self.closed = True
+            self.queue.clear()
+            self._has_data.notify()
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.shutdown()
+        self.connection.close()
@@ -0,0 +1,344 @@
+""" Run the games of many rooms in worker processes so separate books use separate cores.
+
+The front end keeps the sockets. It gives every client a number and forwards the commands of a room
+to the worker that hosts it; the worker runs an ordinary Game with stand-in clients on its own
+Sequencer and sends back, once per batch, the bytes to write to each client. Fills and the top of
+every book are also published after each batch through shared memory rings (see marketdata.py),
+which the front end reads without any pickling.
+"""
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+
+from client_communication_tool import ClientCommunicator
+from game import Game
+from journal import Journal
+from marketdata import MarketDataReader, MarketDataWriter
+from sequencer import Sequencer
+
+LOG = logging.getLogger(__name__)
+POLL_SECONDS = 0.1
+
+
+class RemoteClient:
+    """ Stands in for a front end connection inside a worker process. """
+    __slots__ = ("key", "outbox")
+
+    def __init__(self, key, outbox):
+        self.key = key
+        self.outbox = outbox
+
+    def __repr__(self):
+        return f"RemoteClient({self.key})"
+
+    def sendall(self, data):
+        self.outbox.append((self.key, data, False))
+
+    def send_snapshot(self, data):
+        self.outbox.append((self.key, data, True))
+
+
+class GameHost:
+    """ The games of the rooms assigned to one worker process. """
+
+    def __init__(self, results, publish_hz, market_data=None, journal=None, book_depth=None):
+        self.results = results
+        self.publish_hz = publish_hz
+        self.book_depth = book_depth
+        self.market_data = market_data
+        self.journal = journal
+        self.outbox = []
+        self.clients = {}
+        self.games = {}
+        self.room2book = {}
+        self.room2game_number = {}
+        self.started = {}
+        self.communicator = ClientCommunicator()
+        self.sequencer = Sequencer(after_batch=self.flush)
+
+    def client(self, key):
+        client = self.clients.get(key)
+        if client is None:
+            client = self.clients[key] = RemoteClient(key, self.outbox)
+        return client
+
+    def game(self, room):
+        game = self.games.get(room)
+        if game is None:
+            game = self.games[room] = Game(self.communicator, self.sequencer.call_later, self.publish_hz, self.journal, self.book_depth)
+        return game
+
+    def apply(self, command, room, *args):
+        if command == "start":
+            keys, duration, orderbook_is_dark, book = args
+            if self.game(room).start({self.client(key) for key in keys}, duration, orderbook_is_dark):
+                self.room2book[room] = book
+                self.room2game_number[room] = self.room2game_number.get(room, 0) + 1
+        elif command == "stop":
+            self.game(room).stop()
+        elif command == "messages":
+            key, messages = args
+            for receiver, text in self.game(room).handle_messages(self.client(key), messages) or []:
+                self.communicator.send_to_clients(receiver, text)
+        elif command == "leave":
+            key, = args
+            client = self.clients.pop(key, None)
+            if client is not None:
+                for game in self.games.values():
+                    game.remove_client(client)
+                self.communicator.forget(client)
+        elif command == "drop":
+            self.games.pop(room, None)
+            self.started.pop(room, None)
+            self.room2game_number.pop(room, None)
+            book = self.room2book.pop(room, None)
+            if book is not None and self.market_data is not None:
+                self.market_data.forget(book)
+        elif command == "send":
+            keys, message = args
+            self.communicator.send_to_clients([self.client(key) for key in keys], message)
+
+    def flush(self):
+        """ Publish the batch's market data, then report what it sent and which games started or ended. """
+        if self.market_data is not None:
+            for room, book in self.room2book.items():
+                self.market_data.publish(book, self.room2game_number[room], self.games[room])
+        events = []
+        for room, game in self.games.items():
+            if self.started.get(room, False) != game.started:
+                self.started[room] = game.started
+                events.append((room, game.started, game.leaderboard))
+        if self.outbox or events:
+            self.results.put((self.outbox.copy(), events))
+            self.outbox.clear()
+
+
+def worker_main(inbox, results, publish_hz, market_data_names, journal_path, book_depth):
+    market_data = MarketDataWriter(*market_data_names)
+    journal = Journal(journal_path) if journal_path else None
+    host = GameHost(results, publish_hz, market_data, journal, book_depth)
+    host.sequencer.start()
+    while True:
+        item = inbox.get()
+        if item is None:
+            # Let the commands already handed to the sequencer finish before closing what they write to.
+            done = threading.Event()
+            host.sequencer.call_soon(done.set)
+            done.wait()
+            market_data.close()
+            if journal is not None:
+                journal.close()
+            return
+        host.sequencer.call_soon(host.apply, *item)
+
+
+class RemoteCommunicator:
+    """ Sends the server's messages to the players of a remote game, after their persistent information. """
+
+    def __init__(self, game):
+        self.game = game
+
+    def send_to_clients(self, clients, message):
+        keys = [self.game.pool.key(client) for client in clients]
+        self.game.worker.post(("send", self.game.room, keys, message))
+
+
+class RemoteGame:
+    """ The part of the Game API that server.py uses, for a game running in a worker process. """
+
+    def __init__(self, pool, worker, room, book):
+        self.pool = pool
+        self.worker = worker
+        self.room = room
+        self.book = book
+        self.started = False
+        self.leaderboard = []
+        self.client_communicator = RemoteCommunicator(self)
+
+    def start(self, clients, duration, orderbook_is_dark):
+        if self.started:
+            return False
+        self.started = True
+        keys = [self.pool.key(client) for client in clients]
+        self.worker.post(("start", self.room, keys, duration, orderbook_is_dark, self.book))
+        return True
+
+    def stop(self):
+        if self.started:
+            self.started = False
+            self.worker.post(("stop", self.room))
+            return True
+        return False
+
+    def is_started(self):
+        return self.started
+
+    def handle_messages(self, client, client_messages):
+        self.worker.post(("messages", self.room, self.pool.key(client), client_messages))
+        return None
+
+    def remove_client(self, client):
+        """ Nothing to do here: WorkerPool.forget tells every worker once that the client left. """
+
+    def top_of_book(self):
+        return self.worker.market_data.top_of_book(self.book)
+
+
+class Worker:
+    """ One worker process, the queue of commands for it and the market data it publishes. """
+
+    def __init__(self, context, results, publish_hz, number, journal_path=None, book_depth=None):
+        self.inbox = context.Queue()
+        self.market_data = MarketDataReader()
+        self.process = context.Process(
+            target=worker_main,
+            args=(self.inbox, results, publish_hz, self.market_data.names(), f"{journal_path}.{number}" if journal_path else None, book_depth),
+            name=f"matching-{number}",
+            daemon=True,
+        )
+
+    def post(self, item):
+        self.inbox.put(item)
+
+    def stop(self):
+        self.inbox.put(None)
+        if self.process.pid is not None:
+            self.process.join()
+        self.market_data.close()
+
+
+class WorkerPool:
+    """ Worker processes that host the games of the rooms.
+
+    Rooms are assigned round robin to a fixed number of workers, or with per_room every room gets a
+    worker of its own, which is stopped and its shared memory unlinked when the room is dropped.
+    new_game and drop_game can be passed to GameRegistry as they are.
+
+    A background thread takes the workers' results off the results queue and hands them to
+    call_soon, which should run them on the thread that owns the clients and the registry (the
+    matching thread or the event loop), so sockets and game state have a single owner.
+    """
+
+    def __init__(self, workers, publish_hz=0, per_room=False, journal_path=None, book_depth=None, call_soon=None):
+        self.call_soon = call_soon
+        self.context = multiprocessing.get_context("spawn")
+        self.results = self.context.Queue()
+        self.publish_hz = publish_hz
+        self.book_depth = book_depth
+        self.per_room = per_room
+        self.journal_path = journal_path
+        self.lock = threading.Lock()
+        self.started = False
+        self.worker_count = 0
+        self.workers = [self.new_worker() for _ in range(0 if per_room else workers)]
+        self.assign = itertools.cycle(self.workers)
+        self.games = {}
+        self.book_count = 0
+        self.client2key = {}
+        self.key2client = {}
+        self.next_key = 1
+        self.thread = None
+
+    def new_worker(self):
+        self.worker_count += 1
+        return Worker(self.context, self.results, self.publish_hz, self.worker_count, self.journal_path, self.book_depth)
+
+    def start(self):
+        for worker in self.workers:
+            worker.process.start()
+        self.started = True
+        self.thread = threading.Thread(target=self.receive, name="worker-results", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            for worker in self.workers:
+                worker.stop()
+            self.workers = []
+
+    def new_game(self, room):
+        if self.per_room:
+            worker = self.new_worker()
+            with self.lock:
+                self.workers.append(worker)
+            if self.started:
+                worker.process.start()
+        else:
+            worker = next(self.assign)
+        self.book_count += 1
+        game = self.games[room] = RemoteGame(self, worker, room, self.book_count)
+        return game
+
+    def drop_game(self, room):
+        game = self.games.pop(room, None)
+        if game is None:
+            return
+        if self.per_room:
+            with self.lock:
+                self.workers.remove(game.worker)
+            # Joining the process takes a moment, keep it off the caller's thread.
+            threading.Thread(target=game.worker.stop, name="worker-stop", daemon=True).start()
+        else:
+            game.worker.post(("drop", room))
+            with self.lock:
+                game.worker.market_data.forget(game.book)
+
+    def key(self, client):
+        key = self.client2key.get(client)
+        if key is None:
+            key = self.client2key[client] = self.next_key
+            self.key2client[key] = client
+            self.next_key += 1
+        return key
+
+    def forget(self, client):
+        """ Forget a client that disconnected and have every worker cancel its orders in the games it hosts. """
+        key = self.client2key.pop(client, None)
+        if key is not None:
+            del self.key2client[key]
+            with self.lock:
+                for worker in self.workers:
+                    worker.post(("leave", None, key))
+
+    def poll_market_data(self):
+        with self.lock:
+            for worker in self.workers:
+                worker.market_data.poll()
+
+    def receive(self):
+        while True:
+            try:
+                result = self.results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                self.hand_over(self.poll_market_data)
+                continue
+            self.hand_over(self.apply_results, *result)
+
+    def hand_over(self, callback, *args):
+        if self.call_soon is None:
+            callback(*args)
+        else:
+            self.call_soon(callback, *args)
+
+    def apply_results(self, sends, events):
+        """ Send what a worker's batch wrote to its clients and note which of its games started or ended. """
+        for key, data, is_snapshot in sends:
+            client = self.key2client.get(key)
+            if client is None:
+                continue
+            send_snapshot = getattr(client, "send_snapshot", None) if is_snapshot else None
+            try:
+                if send_snapshot is not None:
+                    send_snapshot(data)
+                else:
+                    client.sendall(data if isinstance(data, bytes) else b"".join(data))
+            except OSError:
+                pass
+        for room, started, leaderboard in events:
+            game = self.games.get(room)
+            if game is not None:
+                game.started = started
+                game.leaderboard = leaderboard
+        self.poll_market_data()